@@ -13,18 +13,16 @@ from datetime import datetime, timedelta
 import sys
 import os
 import time
+import threading
 from io import BytesIO
 import json
 import chardet
 import hashlib
 import re
+import uuid
 from pathlib import Path
 from statsmodels.tsa.seasonal import seasonal_decompose
-from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from sklearn.ensemble import IsolationForest
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -32,123 +30,202 @@ warnings.filterwarnings('ignore')
 # Add path for imports
 sys.path.append(os.path.dirname(__file__))
 import model
+import ingest
+import local_store
+import migrate
+import storage
+import write_behind
 
 # FIREBASE SETUP MOVED BELOW (kept for clarity)
 
 # ===== DATABASE FUNCTIONS =====
+# All reads/writes go through a storage backend (storage.py), which records
+# per-operation counts, document reads/writes and latencies.
 
-def load_users_from_json():
-    """Fallback: Load from users.json"""
-    try:
-        if os.path.exists('users.json'):
-            with open('users.json', 'r') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"Error loading users.json: {e}")
-    return {}
+USER_CACHE_TTL = 30  # seconds a cached user profile is trusted
 
 
-def save_users_to_json(users):
-    """Fallback: Save to users.json"""
-    try:
-        with open('users.json', 'w') as f:
-            json.dump(users, f, indent=2)
-        return True
-    except Exception as e:
-        print(f"Error saving users.json: {e}")
-        return False
+@st.cache_resource
+def _user_profile_cache():
+    """Process-wide {username: (fetched_at, profile)} shared by all sessions"""
+    return {}
 
 
 def load_users():
-    """Load all users from Firebase (fallback to JSON if Firebase not available)"""
-    if is_firebase_available():
-        try:
-            users_ref = db.collection('users')
-            docs = users_ref.stream()
-            
-            users = {}
-            for doc in docs:
-                users[doc.id] = doc.to_dict()
-            return users
-        except Exception as e:
-            print(f"Error loading users from Firebase: {e}")
-            # Fallback to JSON
-            return load_users_from_json()
-    else:
-        return load_users_from_json()
+    """Load all users (Firebase, or the local SQLite store)"""
+    try:
+        return get_storage().load_users()
+    except Exception as e:
+        print(f"Error loading users: {e}")
+        report_storage_error(e)
+        return {}
 
 
 def save_users(users):
-    """Save all users to Firebase"""
-    if is_firebase_available():
-        try:
-            batch = db.batch()
-            users_ref = db.collection('users')
-            
-            # Update each user individually (don't delete all)
-            for username, user_data in users.items():
-                doc_ref = users_ref.document(username)
-                batch.set(doc_ref, user_data, merge=True)  # Use merge to preserve existing data
-            
-            batch.commit()
-            print(f"✅ Saved {len(users)} users to Firebase")
-            return True
-        except Exception as e:
-            print(f"❌ Error saving users to Firebase: {e}")
-            return False
-    else:
-        # Fallback to JSON
-        return save_users_to_json(users)
-
-def get_user(username):
-    """Get single user from Firebase"""
+    """Merge the given user profiles into the database"""
     try:
-        doc_ref = db.collection('users').document(username)
-        doc = doc_ref.get()
-        if doc.exists:
-            return {doc.id: doc.to_dict()}
-        return {}
+        saved = get_storage().save_users(users)
+        print(f"✅ Saved {len(users)} users")
+    except Exception as e:
+        print(f"❌ Error saving users: {e}")
+        report_storage_error(e)
+        return False
+    
+    cache = _user_profile_cache()
+    for username in users:
+        cache.pop(username, None)
+    return saved
+
+def get_user(username, use_cache=True):
+    """Get single user by id (point lookup, cached for USER_CACHE_TTL seconds)"""
+    cache = _user_profile_cache()
+    cached = cache.get(username)
+    if use_cache and cached is not None and time.time() - cached[0] < USER_CACHE_TTL:
+        return {username: cached[1]}
+    
+    try:
+        user_data = get_storage().get_user(username)
+    except FirestoreUnavailable:
+        raise  # "Username not found" would be wrong; let the caller show the outage
     except Exception as e:
         print(f"Error getting user: {e}")
+        report_storage_error(e)
+        return {}
+    
+    if user_data is None:
+        cache.pop(username, None)
         return {}
+    cache[username] = (time.time(), user_data)
+    return {username: user_data}
 
 def update_user(username, user_data):
-    """Update single user in Firebase"""
+    """Update only the given fields of a single user"""
     try:
-        doc_ref = db.collection('users').document(username)
-        doc_ref.set(user_data, merge=True)
+        get_storage().update_user(username, user_data)
+        
+        cache = _user_profile_cache()
+        cached = cache.get(username)
+        if cached is not None:
+            cache[username] = (cached[0], {**cached[1], **user_data})
         return True
     except Exception as e:
         print(f"Error updating user: {e}")
+        report_storage_error(e)
         return False
 
 def delete_user(username):
-    """Delete user from Firebase"""
+    """Delete user (and its email index entry)"""
     try:
-        doc_ref = db.collection('users').document(username)
-        doc_ref.delete()
+        get_storage().delete_user(username)
+        _user_profile_cache().pop(username, None)
         return True
     except Exception as e:
         print(f"Error deleting user: {e}")
+        report_storage_error(e)
+        return False
+
+def create_user(username, user_data):
+    """Create a user together with its email index entry.
+    Returns None on success, otherwise the reason it was rejected."""
+    return get_storage().create_user(username, user_data)
+
+# ===== FORECAST RECORDS =====
+# Each saved forecast is its own record: users/{username}/forecasts/{id} in
+# Firestore, a row of the forecasts table locally. Saving is one insert and
+# deleting is one delete, whatever the size of the history.
+HISTORY_PAGE_SIZE = 5
+
+
+def new_forecast_id():
+    """Time-sortable forecast id"""
+    return f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{uuid.uuid4().hex[:6]}"
+
+
+def add_forecast(username, record, profile_updates=None):
+    """Insert one forecast record (plus small profile field updates); returns its id"""
+    record = dict(record)
+    record.setdefault('id', new_forecast_id())
+    record.setdefault('created_at', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    try:
+        get_storage().add_forecast(username, record, profile_updates)
+        _user_profile_cache().pop(username, None)
+        return record['id']
+    except Exception as e:
+        print(f"Error saving forecast: {e}")
+        return None
+
+
+def delete_forecast(username, forecast_id):
+    """Delete one forecast record"""
+    try:
+        get_storage().delete_forecast(username, forecast_id)
+        _user_profile_cache().pop(username, None)
+        return True
+    except Exception as e:
+        print(f"Error deleting forecast: {e}")
         return False
 
+
+def clear_forecasts(username):
+    """Delete every forecast record of a user"""
+    try:
+        get_storage().clear_forecasts(username)
+        _user_profile_cache().pop(username, None)
+        return True
+    except Exception as e:
+        print(f"Error clearing forecasts: {e}")
+        return False
+
+
+def ensure_forecast_records(username, user_data=None):
+    """Move a legacy forecast_history array on the profile into records (once)"""
+    history = (user_data or {}).get('forecast_history') or []
+    if not history:
+        return
+    records = storage.legacy_forecast_records(history)
+    try:
+        get_storage().migrate_forecast_history(username, records)
+        _user_profile_cache().pop(username, None)
+    except Exception as e:
+        print(f"Error migrating forecast history: {e}")
+
+
+def count_forecasts(username, user_data=None):
+    """Number of saved forecasts without loading any of them"""
+    try:
+        return get_storage().count_forecasts(username, user_data)
+    except Exception as e:
+        print(f"Error counting forecasts: {e}")
+        return 0
+
+
+def load_forecast_page(username, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    """One page of forecast records, newest first, starting after cursor.
+    Returns (records, next_cursor); next_cursor is None on the last page."""
+    try:
+        records = get_storage().forecast_page(username, cursor, page_size + 1)
+        if len(records) > page_size:
+            return records[:page_size], records[page_size - 1]['id']
+        return records, None
+    except Exception as e:
+        print(f"Error loading forecasts: {e}")
+        return [], None
+
 # ===== MIGRATION FUNCTION =====
 def migrate_json_to_firebase():
-    """Migrate existing users.json to Firebase"""
+    """Migrate existing users.json to Firebase (bounded, concurrent, resumable batches)"""
     try:
+        db = get_db()
         if os.path.exists('users.json'):
             with open('users.json', 'r') as f:
                 users = json.load(f)
             
-            batch = db.batch()
-            users_ref = db.collection('users')
-            
-            for username, user_data in users.items():
-                doc_ref = users_ref.document(username)
-                batch.set(doc_ref, user_data)
-            
-            batch.commit()
-            st.success(f"✅ Migrated {len(users)} users to Firebase!")
+            progress_bar = st.progress(0)
+            report = migrate.migrate_users(db, users, progress=lambda done, total: progress_bar.progress(done / max(total, 1)))
+            if report['failed_batches']:
+                st.error(f"Migration incomplete: {migrate.format_report(report)}")
+                return False
+            st.success(f"✅ Migrated {migrate.format_report(report)}")
             return True
     except Exception as e:
         st.error(f"Migration error: {e}")
@@ -281,69 +358,175 @@ st.set_page_config(
 # ===== FIREBASE SETUP =====
 import firebase_admin
 from firebase_admin import credentials, firestore
-import json
-import os
-import streamlit as st
 
-# Initialize Firebase
-firebase_configured = False
-firebase_secrets = None
-# ensure db variable exists
-db = None
-
-# Method 1: Check Streamlit secrets FIRST (for deployed app)
-try:
-    firebase_secrets = dict(st.secrets["firebase"])
-    firebase_configured = True
-    print("✅ Firebase configured using Streamlit secrets")
-except Exception as e:
-    print(f"⚠️ No Streamlit secrets: {e}")
-
-# Method 2: Check for firebase-key.json file (local development)
-if not firebase_configured and os.path.exists('firebase-key.json'):
+# Created once per process (not on every rerun). The client is checked at
+# most every DB_HEALTH_CHECK_INTERVAL seconds, or on the next use after an
+# error, and rebuilt if the check fails.
+DB_HEALTH_CHECK_INTERVAL = 300  # seconds between health checks
+DB_RECONNECT_DELAY = 30  # seconds before retrying a failed connection
+
+
+def load_firebase_secrets():
+    """Firebase credentials from Streamlit secrets or firebase-key.json (None if not configured)"""
+    # Method 1: Check Streamlit secrets FIRST (for deployed app)
     try:
-        with open('firebase-key.json', 'r') as f:
-            firebase_secrets = json.load(f)
-        firebase_configured = True
-        print("✅ Firebase configured using firebase-key.json")
+        firebase_secrets = dict(st.secrets["firebase"])
+        print("✅ Firebase configured using Streamlit secrets")
+        return firebase_secrets
     except Exception as e:
-        print(f"⚠️ Error reading firebase-key.json: {e}")
+        print(f"⚠️ No Streamlit secrets: {e}")
+    
+    # Method 2: Check for firebase-key.json file (local development)
+    if os.path.exists('firebase-key.json'):
+        try:
+            with open('firebase-key.json', 'r') as f:
+                firebase_secrets = json.load(f)
+            print("✅ Firebase configured using firebase-key.json")
+            return firebase_secrets
+        except Exception as e:
+            print(f"⚠️ Error reading firebase-key.json: {e}")
+    return None
 
-# Initialize Firebase if configured
-if firebase_configured:
-    try:
-        # Check if already initialized
-        if not firebase_admin._apps:
-            cred = credentials.Certificate(firebase_secrets)
-            firebase_admin.initialize_app(cred)
-        
-        # Get Firestore client
-        db = firestore.client()
-        print("✅ Firebase initialized successfully!")
-        
-        # Test connection
+
+class FirestoreUnavailable(RuntimeError):
+    """Firebase is configured but Firestore can't be reached right now"""
+
+
+class FirestoreConnection:
+    """Lazily connected Firestore client with health checks and reconnect"""
+    def __init__(self):
+        self.secrets = load_firebase_secrets()
+        self._client = None
+        self._lock = threading.Lock()
+        self._checked_at = 0
+        self._failed_at = 0
+        self._apps = 0
+        if self.secrets is None:
+            print("⚠️ Firebase not configured - running in local mode")
+    
+    def _connect(self):
         try:
-            # Simple test - just try to access collection
-            test_ref = db.collection('users')
-            print("✅ Firestore client ready")
+            # The first connect reuses a default app initialized elsewhere in the
+            # process; reconnects get a new app (and client) under a name that isn't
+            # taken yet. Earlier apps are never deleted, since other sessions may
+            # still be using their clients
+            if self._apps == 0 and firebase_admin._DEFAULT_APP_NAME in firebase_admin._apps:
+                app = firebase_admin.get_app()
+            else:
+                name = firebase_admin._DEFAULT_APP_NAME
+                while name in firebase_admin._apps:
+                    self._apps += 1
+                    name = f"forecastpro-{self._apps}"
+                app = firebase_admin.initialize_app(credentials.Certificate(self.secrets), name=name)
+            self._apps += 1
+            self._client = firestore.client(app)
+            self._checked_at = time.time()
+            print("✅ Firebase initialized successfully!")
         except Exception as e:
-            print(f"⚠️ Firestore test failed: {e}")
-            db = None
-            
-    except Exception as e:
-        print(f"❌ Firebase initialization error: {e}")
-        db = None
-else:
-    print("⚠️ Firebase not configured - running in local mode")
-    db = None
+            print(f"❌ Firebase initialization error: {e}")
+            self._client = None
+            self._failed_at = time.time()
+    
+    def _healthy(self):
+        try:
+            self._client.collection('users').limit(1).get(timeout=5)
+            return True
+        except Exception as e:
+            print(f"⚠️ Firestore health check failed: {e}")
+            return False
+    
+    def client(self):
+        """The Firestore client, or None when Firebase is not configured.
+        Raises FirestoreUnavailable while a configured Firestore can't be reached."""
+        if self.secrets is None:
+            return None
+        now = time.time()
+        if self._client is not None and now - self._checked_at < DB_HEALTH_CHECK_INTERVAL:
+            return self._client
+        with self._lock:
+            if self._client is None:
+                if now - self._failed_at >= DB_RECONNECT_DELAY:
+                    self._connect()
+            elif now - self._checked_at >= DB_HEALTH_CHECK_INTERVAL:
+                if self._healthy():
+                    self._checked_at = now
+                else:
+                    self._connect()
+            if self._client is None:
+                retry_in = max(0, int(DB_RECONNECT_DELAY - (time.time() - self._failed_at)))
+                raise FirestoreUnavailable(f"The database is temporarily unreachable, retrying in {retry_in}s")
+            return self._client
+    
+    def report_error(self, error):
+        """Re-check the connection on next use"""
+        print(f"⚠️ Firestore error, connection will be re-checked: {error}")
+        self._checked_at = 0
+
+
+@st.cache_resource
+def get_db_connection():
+    """Process-wide Firestore connection"""
+    return FirestoreConnection()
+
 
+def get_db():
+    """Firestore client for this call (None in local mode; raises FirestoreUnavailable while unreachable)"""
+    return get_db_connection().client()
 
 
-# Helper function to check if Firebase is available
+# Helper function to check if Firebase is available (decided once per process,
+# so a Firestore outage never switches sessions over to the local store)
 def is_firebase_available():
-    return db is not None
+    return STORAGE_BACKEND != 'memory' and get_db_connection().secrets is not None
 
 
+@st.cache_resource
+def get_write_queue():
+    """Process-wide write-behind queue for Firestore (commits from a worker thread)"""
+    return write_behind.WriteBehindQueue(get_db, on_error=get_db_connection().report_error)
+
+
+STORAGE_BACKEND = os.environ.get('FORECASTPRO_STORAGE', '').lower()  # 'memory' keeps everything in-process
+
+
+@st.cache_resource
+def _firestore_storage():
+    return storage.FirestoreBackend(get_db, get_write_queue())
+
+
+@st.cache_resource
+def _local_storage():
+    return storage.LocalBackend()
+
+
+@st.cache_resource
+def _memory_storage():
+    return storage.MemoryBackend()
+
+
+def get_storage():
+    """Storage backend of this process: in-memory if requested, else Firestore when configured, else SQLite"""
+    if STORAGE_BACKEND == 'memory':
+        return _memory_storage()
+    if is_firebase_available():
+        return _firestore_storage()
+    return _local_storage()
+
+
+def report_storage_error(error):
+    """Have the Firestore connection re-checked after a failed call"""
+    if STORAGE_BACKEND != 'memory' and get_db_connection().secrets is not None:
+        get_db_connection().report_error(error)
+
+
+@st.cache_resource
+def init_local_store():
+    """Create the SQLite store and import users.json / users.json.backup once per process"""
+    return local_store.import_json_users()
+
+if STORAGE_BACKEND != 'memory' and not is_firebase_available():
+    init_local_store()
+
 
 # ===== ADMIN CHECK FOR MIGRATION =====
 # Only show migration option to specific admin users
@@ -376,7 +559,9 @@ if 'logged_in' not in st.session_state:
     st.session_state.data_loaded = False
     st.session_state.df = None
     st.session_state.data_source = None
-    st.session_state.forecast_history = []
+    st.session_state.history_page = 0
+    st.session_state.history_cursors = [None]
+    st.session_state.history_pages = {}
     st.session_state.forecast_count = 0
     st.session_state.favorite_model = None
     st.session_state.last_forecast = None
@@ -390,6 +575,9 @@ if 'logged_in' not in st.session_state:
     st.session_state.last_forecast_result = None
     st.session_state.data_cleaned = False
     st.session_state.migration_done = False
+    st.session_state.streamed_monthly = None
+    st.session_state.df_fingerprint = None
+    st.session_state.upload_dialect = None
 
 # migration prompt is now restricted to admin users above
 
@@ -404,25 +592,21 @@ def validate_email(email):
 
 def login_user(username, password):
     try:
-        users = load_users()
+        user = get_user(username).get(username)
         
-        if username in users:
-            if users[username]['password'] == hash_password(password):
+        if user is not None:
+            if user['password'] == hash_password(password):
                 st.session_state.logged_in = True
                 st.session_state.username = username
-                st.session_state.user_email = users[username]['email']
-                st.session_state.user_data = users[username]
-                
-                if 'forecast_history' in users[username]:
-                    st.session_state.forecast_history = users[username]['forecast_history']
-                else:
-                    st.session_state.forecast_history = []
+                st.session_state.user_email = user['email']
+                st.session_state.user_data = user
                 
-                st.session_state.forecast_count = len(st.session_state.forecast_history)
+                ensure_forecast_records(username, user)
+                reset_history_pages()
+                st.session_state.forecast_count = count_forecasts(username, user)
                 
-                # Update last login in Firebase
-                users[username]['last_login'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                save_users(users)
+                # Update only last_login on this user's document
+                update_user(username, {'last_login': datetime.now().strftime('%Y-%m-%d %H:%M:%S')})
                 
                 return True, f"Welcome back, {username}!"
             else:
@@ -441,16 +625,10 @@ def register_user(username, password, email, full_name):
         if len(password) < 6:
             return False, "Password must be at least 6 characters"
         
-        users = load_users()
-        
-        if username in users:
+        if get_user(username, use_cache=False):
             return False, "Username already exists"
         
-        for user_data in users.values():
-            if user_data.get('email') == email:
-                return False, "Email already registered"
-        
-        users[username] = {
+        new_user = {
             'username': username,
             'password': hash_password(password),
             'email': email,
@@ -458,7 +636,6 @@ def register_user(username, password, email, full_name):
             'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'last_login': None,
             'forecast_count': 0,
-            'forecast_history': [],
             'favorite_model': None,
             'role': 'Data Scientist',
             'industry': 'Technology',
@@ -469,13 +646,19 @@ def register_user(username, password, email, full_name):
             }
         }
         
-        save_users(users)
+        # Email uniqueness check and creation are point operations on the email index
+        error = create_user(username, new_user)
+        if error:
+            return False, error
         
         return True, "Registration successful! Please login."
     except Exception as e:
         return False, f"Registration error: {str(e)}"
 
 def logout_user():
+    # Don't leave this user's writes behind in the queue (other users' writes aren't waited for)
+    if not get_storage().flush(username=st.session_state.username):
+        print(f"⚠️ Some Firestore writes for {st.session_state.username} are not committed yet; kept for retry")
     st.session_state.logged_in = False
     st.session_state.username = None
     st.session_state.user_email = None
@@ -483,7 +666,7 @@ def logout_user():
     st.session_state.data_loaded = False
     st.session_state.df = None
     st.session_state.data_source = None
-    st.session_state.forecast_history = []
+    reset_history_pages()
     st.session_state.forecast_count = 0
     st.session_state.show_forecast_history = False
     st.session_state.auth_page = "login"
@@ -496,6 +679,48 @@ def logout_user():
     st.session_state.show_delete_confirmation = False
     st.session_state.last_forecast_result = None
     st.session_state.data_cleaned = False
+    st.session_state.streamed_monthly = None
+    st.session_state.df_fingerprint = None
+    st.session_state.upload_dialect = None
+
+# ===== FORECAST HISTORY PAGES =====
+# Only the visible page of history is fetched and drawn. Pages are cached in
+# session state with the cursor that starts each one, so older pages are
+# fetched on demand and reruns don't touch the database.
+def reset_history_pages():
+    """Drop cached history pages after a save/delete"""
+    st.session_state.history_page = 0
+    st.session_state.history_cursors = [None]
+    st.session_state.history_pages = {}
+
+def get_history_page():
+    """Records of the current history page (fetched once per page)"""
+    page = st.session_state.history_page
+    if page not in st.session_state.history_pages:
+        records, next_cursor = load_forecast_page(st.session_state.username,
+                                                  st.session_state.history_cursors[page])
+        st.session_state.history_pages[page] = records
+        if next_cursor and len(st.session_state.history_cursors) == page + 1:
+            st.session_state.history_cursors.append(next_cursor)
+    return st.session_state.history_pages[page]
+
+def render_history_pager(key_prefix):
+    """Newer/Older buttons for the history page"""
+    page = st.session_state.history_page
+    has_older = len(st.session_state.history_cursors) > page + 1
+    if page == 0 and not has_older:
+        return
+    col1, col2, col3 = st.columns([1, 1, 1])
+    with col1:
+        if st.button("◀ Newer", key=f"{key_prefix}_newer", disabled=page == 0, use_container_width=True):
+            st.session_state.history_page -= 1
+            st.rerun()
+    with col2:
+        st.caption(f"Page {page + 1}")
+    with col3:
+        if st.button("Older ▶", key=f"{key_prefix}_older", disabled=not has_older, use_container_width=True):
+            st.session_state.history_page += 1
+            st.rerun()
 
 # ===== HELPER FUNCTION FOR EXPORT =====
 def get_export_data(data, format_type, filename_prefix):
@@ -509,6 +734,28 @@ def get_export_data(data, format_type, filename_prefix):
     else:
         return data.to_json(orient='records', indent=2).encode('utf-8'), "application/json", f"{filename_prefix}.json"
 
+# ===== MONTHLY SERIES FOR FORECAST TABS =====
+def get_monthly_data(df):
+    """Monthly series for the forecast tabs (streamed uploads are already aggregated)"""
+    if st.session_state.get('streamed_monthly') is not None:
+        return st.session_state.streamed_monthly.copy()
+    fingerprint = st.session_state.get('df_fingerprint')
+    if fingerprint is not None and df is st.session_state.get('df'):
+        return model.load_and_preprocess_data(df, fingerprint=fingerprint)
+    return model.load_and_preprocess_data(df)
+
+def get_future_dates(last_date, months):
+    """First day of each of the next `months` months after last_date"""
+    future_dates = []
+    current = last_date
+    for i in range(months):
+        if current.month == 12:
+            current = datetime(current.year + 1, 1, 1)
+        else:
+            current = datetime(current.year, current.month + 1, 1)
+        future_dates.append(current)
+    return future_dates
+
 # ===== DATA CLEANING FUNCTION =====
 def clean_dataset(df):
     """Automatically clean the dataset"""
@@ -540,23 +787,37 @@ def clean_dataset(df):
         if len(df_clean) < before:
             cleaning_actions.append(f"Removed outliers from '{col}'")
     
-    # 4. Convert date columns to datetime
+    # 4. Convert date columns to datetime (format inferred once from a sample)
     for col in df_clean.columns:
-        if df_clean[col].dtype == 'object':
+        if model.is_text_column(df_clean[col]):
             try:
-                test_dates = pd.to_datetime(df_clean[col].head(100), errors='coerce')
+                date_format = model.infer_date_format(df_clean[col].head(100))
+                test_dates = model.parse_dates(df_clean[col].head(100), date_format)
                 if test_dates.notna().sum() > 50:
-                    df_clean[col] = pd.to_datetime(df_clean[col], errors='coerce')
-                    cleaning_actions.append(f"Converted '{col}' to datetime")
+                    df_clean[col] = model.parse_dates(df_clean[col], date_format)
+                    cleaning_actions.append(f"Converted '{col}' to datetime" +
+                                            (f" ({date_format})" if date_format else ""))
             except:
                 continue
     
     # 5. Strip whitespace from string columns
     for col in df_clean.select_dtypes(include=['object']).columns:
         df_clean[col] = df_clean[col].astype(str).str.strip()
+    for col in df_clean.select_dtypes(include=['string']).columns:
+        df_clean[col] = df_clean[col].str.strip()  # keeps Arrow-backed strings
     
     return df_clean, cleaning_actions
 
+# ===== SAMPLE DATA PREWARM =====
+@st.cache_resource
+def prewarm_sample_data():
+    """Build the shared sample dataset and its default forecasts in the background, once per process"""
+    thread = threading.Thread(target=ingest.prewarm_sample, args=(clean_dataset,), name='sample-prewarm', daemon=True)
+    thread.start()
+    return thread
+
+prewarm_sample_data()
+
 # ===== CUSTOM CSS WITH THEME SUPPORT - FIXED DARK MODE =====
 st.markdown(f"""
 <style>
@@ -1215,23 +1476,16 @@ else:
         
         # Delete confirmation dialog
         if st.session_state.show_delete_confirmation and st.session_state.selected_forecast_to_delete is not None:
-            idx = st.session_state.selected_forecast_to_delete
-            forecast = st.session_state.forecast_history[idx]
+            forecast = st.session_state.selected_forecast_to_delete
             
             st.warning(f"Delete forecast from {forecast['date']}?")
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("✅ YES", key="confirm_delete", use_container_width=True):
-                    # Remove from session state
-                    st.session_state.forecast_history.pop(idx)
-                    st.session_state.forecast_count = len(st.session_state.forecast_history)
-                    
-                    # Update Firebase
-                    users = load_users()
-                    if st.session_state.username in users:
-                        users[st.session_state.username]['forecast_history'] = st.session_state.forecast_history
-                        users[st.session_state.username]['forecast_count'] = len(st.session_state.forecast_history)
-                        save_users(users)
+                    # Delete just this forecast record
+                    if delete_forecast(st.session_state.username, forecast['id']):
+                        st.session_state.forecast_count = max(st.session_state.forecast_count - 1, 0)
+                    reset_history_pages()
                     
                     st.session_state.show_delete_confirmation = False
                     st.session_state.selected_forecast_to_delete = None
@@ -1259,7 +1513,7 @@ else:
                     <div class="stat-label">Forecasts</div>
                 </div>
                 <div class="stat-item">
-                    <div class="stat-value">{len(st.session_state.forecast_history)}</div>
+                    <div class="stat-value">{st.session_state.forecast_count}</div>
                     <div class="stat-label">Saved</div>
                 </div>
             </div>
@@ -1270,8 +1524,8 @@ else:
         forecast_text = f"📊 {st.session_state.forecast_count} Forecast"
         if st.session_state.forecast_count != 1:
             forecast_text += "s"
-        if len(st.session_state.forecast_history) > 0:
-            forecast_text += f" ● {len(st.session_state.forecast_history)} saved"
+        if st.session_state.forecast_count > 0:
+            forecast_text += f" ● {st.session_state.forecast_count} saved"
         
         if st.button(forecast_text, key="sidebar_forecast_btn", use_container_width=True):
             st.session_state.show_forecast_history = not st.session_state.show_forecast_history
@@ -1285,10 +1539,9 @@ else:
         st.markdown("---")
         
         # ===== FORECAST HISTORY DISPLAY (SHOWS WHEN CLICKED) =====
-        if st.session_state.show_forecast_history and len(st.session_state.forecast_history) > 0:
+        if st.session_state.show_forecast_history and st.session_state.forecast_count > 0:
             st.markdown("### 📋 Saved Forecasts")
-            for i, forecast in enumerate(reversed(st.session_state.forecast_history)):
-                original_idx = len(st.session_state.forecast_history) - 1 - i
+            for i, forecast in enumerate(get_history_page()):
                 
                 # Create a card for each forecast
                 st.markdown(f"""
@@ -1328,7 +1581,7 @@ else:
                     paper_bgcolor='rgba(0,0,0,0)',
                     plot_bgcolor='rgba(0,0,0,0)'
                 )
-                st.plotly_chart(fig, use_container_width=True, key=f"sidebar_chart_{i}_{original_idx}")
+                st.plotly_chart(fig, use_container_width=True, key=f"sidebar_chart_{forecast['id']}")
                 
                 # Download and Delete buttons
                 col1, col2 = st.columns(2)
@@ -1339,19 +1592,21 @@ else:
                     st.download_button(
                         label="📥 CSV",
                         data=csv,
-                        file_name=f"forecast_{i}.csv",
+                        file_name=f"forecast_{forecast['id']}.csv",
                         mime="text/csv",
-                        key=f"sidebar_download_{i}",
+                        key=f"sidebar_download_{forecast['id']}",
                         use_container_width=True
                     )
                 
                 with col2:
-                    if st.button("🗑️ DELETE", key=f"sidebar_delete_{i}", use_container_width=True):
-                        st.session_state.selected_forecast_to_delete = original_idx
+                    if st.button("🗑️ DELETE", key=f"sidebar_delete_{forecast['id']}", use_container_width=True):
+                        st.session_state.selected_forecast_to_delete = forecast
                         st.session_state.show_delete_confirmation = True
                         st.rerun()
                 
                 st.markdown("</div>", unsafe_allow_html=True)
+            
+            render_history_pager("sidebar_history")
         
         st.markdown("---")
         
@@ -1372,6 +1627,13 @@ else:
         months = st.slider("Months", 1, 36, 6, key="months")
         confidence = st.select_slider("Confidence", options=[80,85,90,95,99], value=95, key="confidence")
         seasonality = st.selectbox("Seasonality", ["Auto-detect", "Monthly", "Quarterly", "None"], key="seasonality")
+        strategy_options = {
+            "🔁 Recursive": "recursive",
+            "🎯 Direct (multi-horizon)": "direct"
+        }
+        selected_strategy = st.selectbox("Forecast Strategy", list(strategy_options.keys()), key="forecast_strategy",
+                                         help="Direct trains all horizons together and predicts every month in one call")
+        forecast_strategy = strategy_options[selected_strategy]
         
         st.markdown("---")
         st.markdown("### 📥 Export Format")
@@ -1381,9 +1643,9 @@ else:
         logout_user()
         st.rerun()
     
-    if st.session_state.show_forecast_history and len(st.session_state.forecast_history) > 0:
+    if st.session_state.show_forecast_history and st.session_state.forecast_count > 0:
         with st.expander("📋 Forecast History", expanded=True):
-            for i, forecast in enumerate(reversed(st.session_state.forecast_history)):
+            for i, forecast in enumerate(get_history_page()):
                 st.markdown(f"""
                 <div class="history-item">
                     <div class="history-header">
@@ -1409,7 +1671,7 @@ else:
                     line=dict(color=colors['primary'], width=2)
                 ))
                 fig = create_legend_chart(fig, "Months", "Value")
-                st.plotly_chart(fig, use_container_width=True, key=f"history_chart_{i}_{original_idx}_{int(time.time())}")
+                st.plotly_chart(fig, use_container_width=True, key=f"history_chart_{forecast['id']}")
                 
                 hist_df = pd.DataFrame({
                     'Period': [f"Month {i+1}" for i in range(len(forecast['values']))],
@@ -1422,10 +1684,12 @@ else:
                     data=export_data,
                     file_name=fname,
                     mime=mime,
-                    key=f"download_hist_{i}"
+                    key=f"download_hist_{forecast['id']}"
                 )
                 st.markdown("---")
             
+            render_history_pager("expander_history")
+            
             if st.button("Close History", use_container_width=True):
                 st.session_state.show_forecast_history = False
                 st.rerun()
@@ -1439,12 +1703,24 @@ else:
     with col1:
         uploaded_file = st.file_uploader("Upload file", type=['csv', 'xlsx', 'xls', 'json'], 
                                         label_visibility="collapsed", key="uploader")
+        large_file_mode = st.checkbox("⚡ Large file mode (stream CSV straight into monthly totals)",
+                                      key="large_file_mode",
+                                      help="Reads the CSV in chunks so very large exports fit in memory. "
+                                           "Only the monthly series is kept, so row-level tabs show monthly data.")
+        arrow_engine = st.checkbox("🏹 Fast CSV parser (pyarrow, multithreaded)",
+                                   key="arrow_engine", disabled=not ingest.ARROW_AVAILABLE,
+                                   help="Parses on all cores into Arrow-backed string columns (much less memory "
+                                        "for text-heavy exports). Falls back to the standard parser if the file "
+                                        "is not supported.")
     with col2:
         if st.button("📁 Sample Data", use_container_width=True):
             st.session_state.last_forecast_result = None
             st.session_state.data_source = "sample"
             st.session_state.data_loaded = True
             st.session_state.using_sample_data = True
+            st.session_state.streamed_monthly = None
+            st.session_state.df_fingerprint = None
+            st.session_state.upload_dialect = None
             st.rerun()
     with col3:
         if st.button("🗑️ Clear", use_container_width=True):
@@ -1454,16 +1730,22 @@ else:
             st.session_state.using_sample_data = False
             st.session_state.data_cleaned = False
             st.session_state.last_forecast_result = None
+            st.session_state.streamed_monthly = None
+            st.session_state.df_fingerprint = None
+            st.session_state.upload_dialect = None
             st.rerun()
     
     if st.session_state.data_loaded and st.session_state.df is not None:
         df_current = st.session_state.df
         status = "DEMO MODE" if st.session_state.using_sample_data else "Your Data"
         cleaned_status = "🧹 Cleaned" if st.session_state.data_cleaned else ""
+        dialect_text = ingest.describe_dialect(st.session_state.get('upload_dialect'))
+        dialect_html = f'<span><i class="fas fa-file-code"></i> {dialect_text}</span>' if dialect_text else ''
         st.markdown(f"""
         <div class="file-info">
             <span><i class="fas fa-file-csv"></i> {st.session_state.data_source if st.session_state.data_source == 'sample' else uploaded_file.name if uploaded_file else 'Dataset'} ({status}) {cleaned_status}</span>
             <span><i class="fas fa-database"></i> {len(df_current):,} rows • {len(df_current.columns)} columns</span>
+            {dialect_html}
         </div>
         """, unsafe_allow_html=True)
     
@@ -1471,24 +1753,25 @@ else:
     
     df = None
     
-    def read_csv_with_encoding(file):
-        encodings = ['utf-8', 'latin-1', 'cp1252', 'ISO-8859-1', 'utf-16']
-        for encoding in encodings:
-            try:
-                file.seek(0)
-                return pd.read_csv(file, encoding=encoding), encoding
-            except:
-                continue
-        return None, None
+    def upload_fingerprint(file):
+        """Hash of the uploaded bytes, computed once per upload (not on every rerun)"""
+        fingerprints = st.session_state.setdefault('upload_fingerprints', {})
+        file_id = getattr(file, 'file_id', None) or (file.name, file.size)
+        if file_id not in fingerprints:
+            fingerprints.clear()
+            fingerprints[file_id] = ingest.fingerprint_bytes(file.getvalue())
+        return fingerprints[file_id]
     
     if st.session_state.data_source == "sample" and st.session_state.data_loaded:
         with st.spinner("Loading sample data..."):
             try:
-                df = pd.read_csv("data/Sample - Superstore.csv", encoding='latin-1')
-                # Auto-clean sample data
-                df, cleaning_actions = clean_dataset(df)
+                # Cleaned once per process and shared by every session
+                sample = ingest.load_sample(clean_dataset)
+                df, cleaning_actions = sample['df'], sample['cleaning_actions']
                 st.session_state.data_cleaned = True
                 st.session_state.df = df
+                st.session_state.df_fingerprint = sample['fingerprint']
+                st.session_state.upload_dialect = None
                 
                 # Show cleaning summary
                 if cleaning_actions:
@@ -1497,37 +1780,43 @@ else:
                             st.write(f"✅ {action}")
                 
                 st.success(f"✅ Sample data loaded and cleaned: {len(df):,} rows (DEMO MODE - Forecasts won't be saved)")
-            except:
-                try:
-                    df = pd.read_csv("data/Sample - Superstore.csv", encoding='utf-8')
-                    # Auto-clean sample data
-                    df, cleaning_actions = clean_dataset(df)
-                    st.session_state.data_cleaned = True
-                    st.session_state.df = df
-                    
-                    # Show cleaning summary
-                    if cleaning_actions:
-                        with st.expander("🧹 Data Cleaning Summary"):
-                            for action in cleaning_actions:
-                                st.write(f"✅ {action}")
+            except Exception as e:
+                st.error(f"Error loading sample: {str(e)}")
+    
+    elif uploaded_file is not None and large_file_mode and uploaded_file.name.endswith('.csv'):
+        with st.spinner("Streaming file into monthly totals..."):
+            try:
+                upload = ingest.ingest_upload(uploaded_file.name, uploaded_file.getvalue, mode='stream',
+                                              fingerprint=upload_fingerprint(uploaded_file))
+                monthly, info = upload['monthly'], upload['info']
+                if monthly is not None:
+                    st.success(f"✅ Streamed {info['rows']:,} rows in {info['chunks']} chunks into "
+                               f"{len(monthly)} months (date: {info['date_col'] or 'synthetic'}, "
+                               f"value: {info['value_col'] or 'synthetic'})")
                     
-                    st.success(f"✅ Sample data loaded and cleaned: {len(df):,} rows (DEMO MODE - Forecasts won't be saved)")
-                except Exception as e:
-                    st.error(f"Error loading sample: {str(e)}")
+                    st.session_state.streamed_monthly = monthly
+                    st.session_state.df = monthly[['Month', 'Sales']]
+                    st.session_state.df_fingerprint = None
+                    st.session_state.upload_dialect = upload['dialect']
+                    st.session_state.data_cleaned = False
+                    st.session_state.data_loaded = True
+                    st.session_state.using_sample_data = False
+                    st.session_state.data_source = "upload"
+                else:
+                    st.error("Could not read file")
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
     
     elif uploaded_file is not None:
         with st.spinner("Loading and cleaning data..."):
             try:
-                if uploaded_file.name.endswith('.csv'):
-                    df, encoding_used = read_csv_with_encoding(uploaded_file)
-                elif uploaded_file.name.endswith(('.xlsx', '.xls')):
-                    df = pd.read_excel(uploaded_file)
-                elif uploaded_file.name.endswith('.json'):
-                    df = pd.read_json(uploaded_file)
+                # Parsed and auto-cleaned once per distinct file, then served from the cache
+                upload = ingest.ingest_upload(uploaded_file.name, uploaded_file.getvalue, clean=clean_dataset,
+                                              fingerprint=upload_fingerprint(uploaded_file),
+                                              engine='pyarrow' if arrow_engine else 'pandas')
+                df, cleaning_actions = upload['df'], upload['cleaning_actions']
                 
                 if df is not None:
-                    # Auto-clean the dataset
-                    df, cleaning_actions = clean_dataset(df)
                     st.session_state.data_cleaned = True
                     
                     # Show cleaning summary
@@ -1540,6 +1829,9 @@ else:
                     st.success(f"✅ Dataset loaded and automatically cleaned: {len(df):,} rows")
                     
                     st.session_state.df = df
+                    st.session_state.df_fingerprint = f"upload:{upload['fingerprint']}"
+                    st.session_state.upload_dialect = upload['dialect']
+                    st.session_state.streamed_monthly = None
                     st.session_state.data_loaded = True
                     st.session_state.using_sample_data = False
                     st.session_state.data_source = "upload"
@@ -1560,6 +1852,7 @@ else:
             "🚀 Generate Forecast",
             "🤖 Model Comparison",
             "🎯 AutoML",
+            "🧩 Segment Forecast",
             "🔍 Anomaly Detection",
             "📋 Forecast History"
         ]
@@ -1831,35 +2124,21 @@ else:
             if st.button("🚀 Generate Forecast", type="primary", use_container_width=True):
                 with st.spinner("Generating forecast..."):
                     try:
-                        monthly = model.load_and_preprocess_data(df)
+                        monthly = get_monthly_data(df)
                         
                         if len(monthly) < 3:
                             st.error("Need at least 3 months of data")
                         else:
-                            trained_model = model.train_model(monthly, model_type)
-                            
-                            last_month = monthly['Month_Num'].iloc[-1]
-                            result = model.forecast_future(trained_model, last_month, months, monthly)
-                            forecast = result['forecast']
-                            
-                            last_date = monthly['Month'].iloc[-1]
-                            future_dates = []
-                            current = last_date
-                            for i in range(months):
-                                if current.month == 12:
-                                    current = datetime(current.year + 1, 1, 1)
-                                else:
-                                    current = datetime(current.year, current.month + 1, 1)
-                                future_dates.append(current)
+                            # Full 36-month path is cached per dataset/model; shorter horizons are slices
+                            path = model.forecast_path(monthly, model_type, months, strategy=forecast_strategy)
+                            trained_model = path['model']
+                            forecast = model.slice_forecast(path, months, confidence)['forecast']
                             
                             # Store results in session state to persist
                             st.session_state.last_forecast_result = {
                                 'monthly': monthly,
-                                'forecast': forecast,
-                                'future_dates': future_dates,
-                                'model': selected_model,
-                                'months': months,
-                                'confidence': confidence
+                                'path': path,
+                                'model': selected_model
                             }
                             
                             # Save to history and update count
@@ -1868,23 +2147,19 @@ else:
                                 
                                 r2_score_value = getattr(trained_model, 'r2', 0)
                                 
-                                st.session_state.forecast_history.append({
+                                record = {
+                                    'id': new_forecast_id(),
                                     'date': datetime.now().strftime('%Y-%m-%d %H:%M'),
                                     'model': selected_model,
                                     'months': months,
                                     'values': forecast,
                                     'metrics': {'R²': r2_score_value},
                                     'r2': r2_score_value
-                                })
-                                
+                                }
                                 st.session_state.favorite_model = selected_model
                                 
-                                users = load_users()
-                                if st.session_state.username in users:
-                                    users[st.session_state.username]['forecast_history'] = st.session_state.forecast_history
-                                    users[st.session_state.username]['forecast_count'] = len(st.session_state.forecast_history)
-                                    users[st.session_state.username]['favorite_model'] = selected_model
-                                    save_users(users)
+                                add_forecast(st.session_state.username, record, {'favorite_model': selected_model})
+                                reset_history_pages()
                                 
                                 st.success(f"✅ Forecast saved! Total forecasts: {st.session_state.forecast_count}")
                             else:
@@ -1897,11 +2172,15 @@ else:
             if st.session_state.last_forecast_result:
                 result = st.session_state.last_forecast_result
                 monthly = result['monthly']
-                forecast = result['forecast']
-                future_dates = result['future_dates']
                 selected_model = result['model']
-                months = result['months']
-                confidence = result['confidence']
+                
+                # Follow the Months/Confidence sliders by slicing the cached path
+                months = min(months, len(result['path']['forecast']))
+                band = model.slice_forecast(result['path'], months, confidence)
+                forecast = band['forecast']
+                upper = band['upper']
+                lower = band['lower']
+                future_dates = get_future_dates(monthly['Month'].iloc[-1], months)
                 
                 # Plot with proper legend
                 fig = go.Figure()
@@ -1927,12 +2206,6 @@ else:
                 ))
                 
                 # Confidence interval
-                std_err = np.std(monthly['Sales']) * 0.1
-                ci_factor = {80: 1.28, 85: 1.44, 90: 1.645, 95: 1.96, 99: 2.576}[confidence]
-                
-                upper = [f + ci_factor * std_err for f in forecast]
-                lower = [max(0, f - ci_factor * std_err) for f in forecast]
-                
                 primary_hex = colors['primary'].lstrip('#')
                 primary_rgb = tuple(int(primary_hex[i:i+2], 16) for i in (0, 2, 4))
                 
@@ -2018,7 +2291,7 @@ else:
             if st.button("🚀 Run Model Comparison", type="primary", use_container_width=True):
                 with st.spinner("Training models..."):
                     try:
-                        monthly = model.load_and_preprocess_data(df)
+                        monthly = get_monthly_data(df)
                         
                         if len(monthly) < 3:
                             st.error("Need at least 3 months of data")
@@ -2039,32 +2312,24 @@ else:
                             
                             progress = st.progress(0)
                             
-                            for idx, m_name in enumerate(['linear', 'polynomial', 'random', 'gradient']):
-                                try:
-                                    models[m_name] = model.train_model(monthly, m_name)
-                                    last = monthly['Month_Num'].iloc[-1]
-                                    result = model.forecast_future(models[m_name], last, months, monthly)
-                                    predictions[m_name] = result['forecast']
-                                    
-                                    if hasattr(models[m_name], 'r2'):
-                                        metrics[m_name] = models[m_name].r2
-                                    else:
-                                        metrics[m_name] = 0
-                                except:
+                            # Models train in parallel worker processes; results arrive as each finishes
+                            for idx, (m_name, trained, forecast, error) in enumerate(
+                                    model.compare_models(monthly, months, list(model_names), strategy=forecast_strategy)):
+                                if error is None:
+                                    models[m_name] = trained
+                                    predictions[m_name] = forecast
+                                    metrics[m_name] = getattr(trained, 'r2', 0)
+                                else:
                                     predictions[m_name] = [0] * months
                                     metrics[m_name] = 0
                                 
                                 progress.progress((idx + 1) / 4)
                             
-                            last_date = monthly['Month'].iloc[-1]
-                            future_dates = []
-                            current = last_date
-                            for i in range(months):
-                                if current.month == 12:
-                                    current = datetime(current.year + 1, 1, 1)
-                                else:
-                                    current = datetime(current.year, current.month + 1, 1)
-                                future_dates.append(current)
+                            # Keep the display order fixed regardless of completion order
+                            predictions = {m_name: predictions[m_name] for m_name in model_names}
+                            metrics = {m_name: metrics[m_name] for m_name in model_names}
+                            
+                            future_dates = get_future_dates(monthly['Month'].iloc[-1], months)
                             
                             fig = go.Figure()
                             
@@ -2098,6 +2363,10 @@ else:
                             }).sort_values('R² Score', ascending=False)
                             st.dataframe(metrics_df, use_container_width=True)
                             
+                            registry_stats = model.model_registry.summary()
+                            st.caption(f"♻️ Model registry: {registry_stats['hits']} reused / {registry_stats['misses']} trained "
+                                       f"• ~{registry_stats['seconds_saved']:.1f}s of training saved")
+                            
                             st.markdown('<div class="export-section">', unsafe_allow_html=True)
                             st.markdown(f'<div class="export-title"><i class="fas fa-download"></i> Export Forecast Results</div>', unsafe_allow_html=True)
                             
@@ -2122,21 +2391,18 @@ else:
                             if not st.session_state.using_sample_data:
                                 st.session_state.forecast_count += 1
                                 
-                                st.session_state.forecast_history.append({
+                                record = {
+                                    'id': new_forecast_id(),
                                     'date': datetime.now().strftime('%Y-%m-%d %H:%M'),
                                     'model': model_names[best_model],
                                     'months': months,
                                     'values': predictions[best_model],
                                     'metrics': metrics,
                                     'r2': metrics[best_model]
-                                })
-                                
-                                users = load_users()
-                                if st.session_state.username in users:
-                                    users[st.session_state.username]['forecast_history'] = st.session_state.forecast_history
-                                    users[st.session_state.username]['forecast_count'] = len(st.session_state.forecast_history)
-                                    users[st.session_state.username]['favorite_model'] = st.session_state.favorite_model
-                                    save_users(users)
+                                }
+                                add_forecast(st.session_state.username, record,
+                                             {'favorite_model': st.session_state.favorite_model})
+                                reset_history_pages()
                                 
                                 st.success(f"✅ Forecast saved! Total forecasts: {st.session_state.forecast_count}")
                             else:
@@ -2156,43 +2422,16 @@ else:
             if st.button("🚀 Run AutoML", type="primary", use_container_width=True):
                 with st.spinner("Running AutoML..."):
                     try:
-                        monthly = model.load_and_preprocess_data(df)
-                        X = monthly[['Month_Num']].values
-                        y = monthly['Sales'].values
-                        
-                        results = []
-                        configs = [
-                            ('Linear Regression', LinearRegression(), {}),
-                            ('Polynomial (deg=2)', LinearRegression(), {'poly': 2}),
-                            ('Polynomial (deg=3)', LinearRegression(), {'poly': 3}),
-                            ('Random Forest (n=50)', RandomForestRegressor(n_estimators=50, random_state=42), {}),
-                            ('Random Forest (n=100)', RandomForestRegressor(n_estimators=100, random_state=42), {}),
-                            ('Gradient Boosting (n=50)', GradientBoostingRegressor(n_estimators=50, random_state=42), {}),
-                            ('Gradient Boosting (n=100)', GradientBoostingRegressor(n_estimators=100, random_state=42), {})
-                        ]
+                        monthly = get_monthly_data(df)
                         
-                        for name, base_model, params in configs:
-                            try:
-                                if 'poly' in params:
-                                    poly = PolynomialFeatures(degree=params['poly'])
-                                    X_train = poly.fit_transform(X)
-                                    base_model.fit(X_train, y)
-                                    y_pred = base_model.predict(X_train)
-                                else:
-                                    base_model.fit(X, y)
-                                    y_pred = base_model.predict(X)
-                                
-                                results.append({
-                                    'Model': name,
-                                    'R²': r2_score(y, y_pred),
-                                    'MAE': mean_absolute_error(y, y_pred),
-                                    'RMSE': np.sqrt(mean_squared_error(y, y_pred))
-                                })
-                            except:
-                                continue
-                        
-                        results_df = pd.DataFrame(results).sort_values('R²', ascending=False)
+                        # Rolling-origin CV; weak configs are pruned after the early folds
+                        progress = st.progress(0)
+                        results_df, info = model.run_automl(
+                            monthly, progress=lambda done, planned: progress.progress(min(done / planned, 1.0)))
                         st.dataframe(results_df.round(3), use_container_width=True)
+                        st.caption(f"⏱️ {info['configurations']} configurations • {info['folds']} time-series folds of "
+                                   f"{info['test_size']} months • {info['fits']} fits instead of {info['exhaustive_fits']} "
+                                   f"with shared fits and successive halving")
                         
                         st.markdown('<div class="export-section">', unsafe_allow_html=True)
                         st.markdown(f'<div class="export-title"><i class="fas fa-download"></i> Export AutoML Results</div>', unsafe_allow_html=True)
@@ -2209,12 +2448,117 @@ else:
                         st.markdown('</div>', unsafe_allow_html=True)
                         
                         best = results_df.iloc[0]
-                        st.success(f"✅ Best Model: {best['Model']} (R²: {best['R²']:.3f})")
+                        st.success(f"✅ Best Model: {best['Model']} (CV RMSE: {best['CV RMSE']:,.0f}, CV R²: {best['CV R²']:.3f})")
                     except Exception as e:
                         st.error(f"AutoML error: {str(e)}")
             st.markdown('</div>', unsafe_allow_html=True)
         
-        # ===== TAB 6: ANOMALY DETECTION =====
+        # ===== TAB 6: SEGMENT FORECAST =====
+        elif selected_tab == "🧩 Segment Forecast":
+            st.markdown('<div class="card">', unsafe_allow_html=True)
+            st.markdown('<div class="card-title"><i class="fas fa-sitemap"></i> Segment Forecast</div>', unsafe_allow_html=True)
+            
+            dimension_options = [col for col in df.columns
+                                 if model.is_text_column(df[col]) and df[col].nunique() < max(2, len(df) // 2)]
+            
+            if st.session_state.get('streamed_monthly') is not None:
+                st.warning("Segment forecasts need row-level data. Re-upload without Large file mode.")
+            elif not dimension_options:
+                st.warning("No categorical columns found to segment by")
+            else:
+                default_dims = [col for col in ['Region', 'Category'] if col in dimension_options]
+                dimensions = st.multiselect("Segment by", dimension_options, default=default_dims, key="segment_dims")
+                segment_mode = st.radio("Segment models", ["Per-segment (parallel)", "Global pooled model"],
+                                        horizontal=True, key="segment_mode",
+                                        help="The global model fits once on all segments and forecasts them together")
+                
+                if st.button("🚀 Forecast All Segments", type="primary", use_container_width=True, disabled=not dimensions):
+                    with st.spinner("Forecasting segments..."):
+                        try:
+                            total_series = get_monthly_data(df)
+                            
+                            if len(total_series) < 3:
+                                st.error("Need at least 3 months of data")
+                            else:
+                                segments = model.build_segment_series(df, dimensions)
+                                n_segments = int(segments['active'].any(axis=1).sum())
+                                
+                                if segment_mode == "Global pooled model":
+                                    # One fit on all segments, one batched predict per month
+                                    results = model.forecast_segments_global(segments, model_type, months)
+                                else:
+                                    # Batches finish in parallel worker processes and stream back here
+                                    progress = st.progress(0)
+                                    status = st.empty()
+                                    results = []
+                                    for batch in model.forecast_segments(segments, model_type, months, strategy=forecast_strategy):
+                                        results.extend(batch)
+                                        progress.progress(len(results) / n_segments)
+                                        status.caption(f"{len(results):,} / {n_segments:,} segments forecast")
+                                
+                                # Top-down reconciliation: segments sum to the total forecast
+                                total_path = model.forecast_path(total_series, model_type, months, strategy=forecast_strategy)
+                                total_forecast = model.reconcile_forecasts(results, model.slice_forecast(total_path, months)['forecast'])
+                                future_dates = get_future_dates(total_series['Month'].iloc[-1], months)
+                                results.sort(key=lambda r: r['history_total'], reverse=True)
+                                
+                                fig = go.Figure()
+                                fig.add_trace(go.Scatter(
+                                    x=future_dates,
+                                    y=total_forecast,
+                                    mode='lines+markers',
+                                    name='🔮 Total Forecast',
+                                    line=dict(color=colors['primary'], width=3),
+                                    marker=dict(size=8)
+                                ))
+                                for r in results[:10]:
+                                    fig.add_trace(go.Scatter(
+                                        x=future_dates,
+                                        y=r['reconciled'],
+                                        mode='lines',
+                                        name=f"🧩 {' / '.join(str(v) for v in r['segment'])}",
+                                        line=dict(width=2, dash='dash')
+                                    ))
+                                fig = create_legend_chart(fig, "Date", "Sales")
+                                st.plotly_chart(fig, use_container_width=True, key="segment_chart")
+                                st.caption(f"Showing the 10 largest of {len(results):,} segments")
+                                
+                                summary_df = pd.DataFrame({
+                                    'Segment': [' / '.join(str(v) for v in r['segment']) for r in results],
+                                    'History Months': [r['history_months'] for r in results],
+                                    'R² Score': [r['r2'] for r in results],
+                                    'Forecast Total': [sum(r['reconciled']) for r in results]
+                                })
+                                st.dataframe(summary_df.round(3), use_container_width=True)
+                                
+                                st.markdown('<div class="export-section">', unsafe_allow_html=True)
+                                st.markdown(f'<div class="export-title"><i class="fas fa-download"></i> Export Segment Forecasts</div>', unsafe_allow_html=True)
+                                
+                                dates_str = [d.strftime('%Y-%m-%d') for d in future_dates]
+                                rows = []
+                                for r in results:
+                                    for date_str, raw, reconciled in zip(dates_str, r['forecast'], r['reconciled']):
+                                        rows.append(dict(zip(dimensions, r['segment']), Date=date_str,
+                                                         Forecast=raw, Reconciled=reconciled))
+                                segment_df = pd.DataFrame(rows)
+                                
+                                export_data, mime, fname = get_export_data(segment_df, export_format, 
+                                                                          f"segment_forecast_{datetime.now().strftime('%Y%m%d_%H%M')}")
+                                st.download_button(
+                                    label=f"📥 Download Segment Forecasts ({export_format})",
+                                    data=export_data,
+                                    file_name=fname,
+                                    mime=mime,
+                                    use_container_width=True
+                                )
+                                st.markdown('</div>', unsafe_allow_html=True)
+                        except Exception as e:
+                            st.error(f"Segment forecast error: {str(e)}")
+                else:
+                    st.info("👆 Pick dimension columns and click 'Forecast All Segments'")
+            st.markdown('</div>', unsafe_allow_html=True)
+        
+        # ===== TAB 7: ANOMALY DETECTION =====
         elif selected_tab == "🔍 Anomaly Detection":
             st.markdown('<div class="card">', unsafe_allow_html=True)
             st.markdown('<div class="card-title"><i class="fas fa-exclamation-triangle"></i> Anomaly Detection</div>', unsafe_allow_html=True)
@@ -2330,15 +2674,15 @@ else:
                 st.warning("No numeric columns found")
             st.markdown('</div>', unsafe_allow_html=True)
         
-        # ===== TAB 7: FORECAST HISTORY =====
+        # ===== TAB 8: FORECAST HISTORY =====
         elif selected_tab == "📋 Forecast History":
             st.markdown('<div class="card">', unsafe_allow_html=True)
             st.markdown('<div class="card-title"><i class="fas fa-history"></i> Forecast History</div>', unsafe_allow_html=True)
             
-            if len(st.session_state.forecast_history) > 0:
-                for i, forecast in enumerate(reversed(st.session_state.forecast_history)):
-                    original_idx = len(st.session_state.forecast_history) - 1 - i
-                    with st.expander(f"📊 Forecast #{len(st.session_state.forecast_history)-i} - {forecast['date']}"):
+            if st.session_state.forecast_count > 0:
+                first_number = st.session_state.forecast_count - st.session_state.history_page * HISTORY_PAGE_SIZE
+                for i, forecast in enumerate(get_history_page()):
+                    with st.expander(f"📊 Forecast #{first_number - i} - {forecast['date']}"):
                         col1, col2, col3 = st.columns(3)
                         with col1:
                             st.info(f"**Model:** {forecast['model']}")
@@ -2356,7 +2700,7 @@ else:
                             line=dict(color=colors['primary'], width=2)
                         ))
                         fig = create_legend_chart(fig, "Months", "Value")
-                        st.plotly_chart(fig, use_container_width=True, key=f"history_chart_{i}_{original_idx}_{int(time.time())}")
+                        st.plotly_chart(fig, use_container_width=True, key=f"tab_history_chart_{forecast['id']}")
                         
                         hist_df = pd.DataFrame({
                             'Period': [f"Month {i+1}" for i in range(len(forecast['values']))],
@@ -2370,27 +2714,25 @@ else:
                             file_name=fname,
                             mime=mime,
                             use_container_width=True,
-                            key=f"download_hist_{i}_{original_idx}"  # ✅ Added unique key
+                            key=f"tab_download_hist_{forecast['id']}"  # ✅ Added unique key
                         )
                         
                         # Delete button in main history
-                        if st.button(f"🗑️ DELETE", key=f"main_delete_{i}_{original_idx}", use_container_width=True):  # ✅ Fixed key
-                            st.session_state.selected_forecast_to_delete = original_idx
+                        if st.button(f"🗑️ DELETE", key=f"main_delete_{forecast['id']}", use_container_width=True):  # ✅ Fixed key
+                            st.session_state.selected_forecast_to_delete = forecast
                             st.session_state.show_delete_confirmation = True
                             st.rerun()
+                
+                render_history_pager("tab_history")
             else:
                 st.info("No forecast history yet. Run a forecast to see results here.")
             
             # Clear all button
-            if len(st.session_state.forecast_history) > 0 and not st.session_state.show_delete_confirmation:
+            if st.session_state.forecast_count > 0 and not st.session_state.show_delete_confirmation:
                 if st.button("🗑️ CLEAR ALL HISTORY", key="clear_all_btn", use_container_width=True):
-                    st.session_state.forecast_history = []
                     st.session_state.forecast_count = 0
-                    users = load_users()
-                    if st.session_state.username in users:
-                        users[st.session_state.username]['forecast_history'] = []
-                        users[st.session_state.username]['forecast_count'] = 0
-                        save_users(users)
+                    clear_forecasts(st.session_state.username)
+                    reset_history_pages()
                     st.rerun()
             
             st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,51 @@
+"""
+PREPROCESSING BENCHMARK
+Rows/second of model.load_and_preprocess_data on synthetic order data
+
+Usage: python benchmarks/preprocess_benchmark.py [rows ...]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import model
+
+DEFAULT_SIZES = [100_000, 1_000_000, 10_000_000]
+
+
+def make_orders(rows, seed=42):
+    """Superstore-like frame: order date, a few numeric and text columns"""
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2014-01-01', 'ns')
+    offsets = rng.integers(0, 4 * 365, rows).astype('timedelta64[D]')
+    return pd.DataFrame({
+        'Row ID': np.arange(1, rows + 1),
+        'Order Date': start + offsets,
+        'Region': rng.choice(['East', 'West', 'Central', 'South'], rows),
+        'Sales': rng.gamma(2.0, 120.0, rows),
+        'Quantity': rng.integers(1, 10, rows),
+        'Discount': rng.choice([0.0, 0.1, 0.2], rows),
+    })
+
+
+def run(sizes, repeats=3):
+    print(f"{'rows':>12} {'best (s)':>10} {'rows/s':>14}")
+    for rows in sizes:
+        df = make_orders(rows)
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model.load_and_preprocess_data(df, use_cache=False)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        print(f"{rows:>12,} {best:>10.3f} {rows / best:>14,.0f}")
+        del df
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    run(sizes)
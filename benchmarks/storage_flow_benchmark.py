@@ -0,0 +1,84 @@
+"""
+STORAGE FLOW BENCHMARK
+Document reads/writes and latency per user action (register → login →
+forecast → history → delete) on the in-memory or local SQLite backend.
+Exits non-zero when an action costs more reads than its budget, so
+full-collection scans show up before they ship.
+
+Usage: python benchmarks/storage_flow_benchmark.py [memory|local] [saved forecasts]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import storage
+
+# Most documents a single action may read, whatever the number of users/forecasts
+# (the local store reads a row before merging an update into it)
+READ_BUDGET = {
+    'register': 3,
+    'login': 3,
+    'save forecast': 1,
+    'history page': 6,
+    'delete forecast': 1,
+    'clear history': None,   # proportional to the history by nature
+}
+
+
+def make_backend(kind):
+    if kind == 'local':
+        return storage.LocalBackend(os.path.join(tempfile.mkdtemp(), 'benchmark.db'))
+    return storage.MemoryBackend()
+
+
+def run_flow(backend, saved=200, other_users=1000):
+    """Run the flow as app.py drives the backend; yields (action, metrics rows)"""
+    backend.save_users({f"user{i}": {'email': f"user{i}@example.com"} for i in range(other_users)})
+    for i in range(saved):
+        backend.add_forecast('alice', {'id': f"{20240101000000 + i:020d}", 'values': [1.0] * 12})
+    backend.reset_metrics()
+
+    def action(name, fn):
+        before = backend.snapshot()
+        fn()
+        return name, backend.metrics_table(since=before)
+
+    yield action('register', lambda: backend.create_user('bob', {'email': 'bob@example.com'}))
+    yield action('login', lambda: (backend.count_forecasts('alice', backend.get_user('alice')),
+                                   backend.update_user('alice', {'last_login': time.time()})))
+    yield action('save forecast', lambda: backend.add_forecast('alice', {'id': '99999999999999999999',
+                                                                           'values': [1.0] * 12},
+                                                                 {'favorite_model': 'linear'}))
+    yield action('history page', lambda: backend.forecast_page('alice', None, 6))
+    yield action('delete forecast', lambda: backend.delete_forecast('alice', '99999999999999999999'))
+    yield action('clear history', lambda: backend.clear_forecasts('alice'))
+
+
+def run(kind='memory', saved=200):
+    backend = make_backend(kind)
+    print(f"backend: {backend.name}, saved forecasts: {saved}")
+    print(f"{'action':<16} {'reads':>6} {'writes':>7} {'ms':>9}  operations")
+    over_budget = []
+    for name, rows in run_flow(backend, saved):
+        reads = sum(row['reads'] for row in rows)
+        writes = sum(row['writes'] for row in rows)
+        ms = sum(row['mean_ms'] * row['calls'] for row in rows)
+        ops = ', '.join(f"{row['operation']}×{row['calls']}" for row in rows)
+        print(f"{name:<16} {reads:>6} {writes:>7} {ms:>9.2f}  {ops}")
+        budget = READ_BUDGET.get(name)
+        if budget is not None and reads > budget:
+            over_budget.append(f"{name}: {reads} reads > {budget}")
+    if over_budget:
+        print("❌ Over read budget: " + '; '.join(over_budget))
+        return 1
+    print("✅ All actions within read budget")
+    return 0
+
+
+if __name__ == '__main__':
+    kind = sys.argv[1] if len(sys.argv) > 1 else 'memory'
+    saved = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    sys.exit(run(kind, saved))
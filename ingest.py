@@ -0,0 +1,463 @@
+"""
+UPLOAD INGEST - PARSE ONCE
+Content Fingerprint • Decode/Parse/Clean Once • Bounded Cache
+"""
+
+import codecs
+import csv
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+import chardet
+import pandas as pd
+
+import model
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+# Cached frames are handed to every session as shallow copies; copy-on-write
+# makes a session's in-place change copy the data instead of writing through
+# to the shared arrays
+pd.set_option('mode.copy_on_write', True)
+
+CSV_ENCODINGS = ['utf-8', 'cp1252', 'latin-1', 'utf-16']   # latin-1 decodes any byte, so cp1252 goes first
+SNIFF_BYTES = 64 * 1024          # bytes inspected to choose encoding and dialect
+SNIFF_DELIMITERS = ',;\t|'
+SNIFF_DIALECT_LINES = 50         # lines given to csv.Sniffer
+CHARDET_BYTES = 4 * 1024         # non-ASCII bytes given to chardet
+
+# ===== UPLOAD CACHE =====
+# Module level, so every rerun and session of this process shares it. Keyed by
+# a hash of the uploaded bytes: a file is decoded, parsed and cleaned once.
+UPLOAD_CACHE_SIZE = 4
+UPLOAD_CACHE_MAX_BYTES = 2 * 1024 ** 3   # memory held by cached frames
+_upload_cache = OrderedDict()
+_upload_cache_lock = threading.Lock()
+_key_locks = {}
+upload_cache_stats = {'hits': 0, 'misses': 0, 'seconds_saved': 0.0}
+
+
+def fingerprint_bytes(data):
+    """
+    Content hash of the uploaded bytes
+    """
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def fallback_encodings(failed):
+    """
+    CSV_ENCODINGS to retry after the sniffed encoding failed, without it
+    (or its aliases)
+    """
+    tried = {codecs.lookup(failed).name}
+    encodings = []
+    for encoding in CSV_ENCODINGS:
+        name = codecs.lookup(encoding).name
+        if name not in tried:
+            tried.add(name)
+            encodings.append(encoding)
+    return encodings
+
+
+# ===== DIALECT SNIFFING =====
+def _sniff_encoding(sample):
+    if sample.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return 'utf-16', 1.0
+    if sample.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig', 1.0
+    try:
+        # A multi-byte character may be cut at the end of the sample
+        sample[:len(sample) - 4 if len(sample) == SNIFF_BYTES else None].decode('utf-8')
+        return 'utf-8', 1.0
+    except UnicodeDecodeError:
+        pass
+    # Only lines with non-ASCII bytes tell encodings apart; keep chardet's input small
+    high = b'\n'.join(line for line in sample.split(b'\n') if max(line, default=0) > 0x7f)
+    detected = chardet.detect(high[:CHARDET_BYTES])
+    encoding = (detected.get('encoding') or 'cp1252').lower()
+    if encoding in ('ascii', 'iso-8859-1', 'windows-1252'):
+        # cp1252 is a superset of latin-1 in the printable range
+        encoding = 'cp1252'
+    return encoding, float(detected.get('confidence') or 0.0)
+
+
+def _header_row(lines, delimiter, quotechar='"'):
+    """
+    Index of the header line: 0 unless the first row's field count differs
+    from the file's usual one (a title row), then the first line that has it.
+    Fields are counted with csv.reader, so quoted delimiters don't count.
+    """
+    rows = []   # (first line of the row, field count)
+    reader = csv.reader(lines, delimiter=delimiter, quotechar=quotechar)
+    start = 0
+    try:
+        for row in reader:
+            if row:
+                rows.append((start, len(row)))
+            start = reader.line_num
+    except csv.Error:
+        return 0
+    if not rows:
+        return 0
+    counts = [count for _, count in rows]
+    usual = max(set(counts), key=counts.count)
+    if counts[0] == usual:
+        return 0
+    return next(line for line, count in rows if count == usual)
+
+
+def _quoted_newlines(lines, delimiter, quotechar='"'):
+    """Whether a quoted value spans lines anywhere in the sample"""
+    reader = csv.reader(lines, delimiter=delimiter, quotechar=quotechar)
+    start = 0
+    try:
+        for _ in reader:
+            if reader.line_num - start > 1:
+                return True
+            start = reader.line_num
+    except csv.Error:
+        return True   # e.g. a quote left open by the cut-off end of the sample
+    return False
+
+
+def sniff_csv(data):
+    """
+    Pick encoding, delimiter, quote character and header row from the first
+    SNIFF_BYTES of a CSV, so it can be parsed once with the right options
+    """
+    sample = data[:SNIFF_BYTES]
+    encoding, confidence = _sniff_encoding(sample)
+    text = sample.decode(encoding, errors='replace')
+    lines = text.splitlines()
+    if len(sample) == SNIFF_BYTES and len(lines) > 1:
+        lines = lines[:-1]   # last line may be cut off
+    
+    try:
+        sniffed = csv.Sniffer().sniff('\n'.join(lines[:SNIFF_DIALECT_LINES]), delimiters=SNIFF_DELIMITERS)
+        delimiter, quotechar = sniffed.delimiter, sniffed.quotechar or '"'
+    except csv.Error:
+        delimiter, quotechar = ',', '"'
+    return {
+        'encoding': encoding,
+        'confidence': round(confidence, 2),
+        'delimiter': delimiter,
+        'quotechar': quotechar,
+        'header_row': _header_row(lines[:SNIFF_DIALECT_LINES], delimiter, quotechar),
+        'quoted_newlines': _quoted_newlines(lines, delimiter, quotechar),
+    }
+
+
+def read_csv_sniffed(data, **read_csv_kwargs):
+    """
+    Parse CSV bytes once with the sniffed dialect; returns (df, dialect).
+    If that fails, retries the other CSV_ENCODINGS with the same delimiter,
+    quote character and header row; (None, None) if none of them works.
+    """
+    dialect = sniff_csv(data)
+    try:
+        df = pd.read_csv(BytesIO(data), **_dialect_kwargs(dialect), **read_csv_kwargs)
+        return df, dialect
+    except Exception as e:
+        print(f"⚠️ Sniffed dialect {describe_dialect(dialect)} failed ({e}); trying other encodings")
+    for encoding in fallback_encodings(dialect['encoding']):
+        retry = dict(dialect, encoding=encoding, confidence=0.0)
+        try:
+            return pd.read_csv(BytesIO(data), **_dialect_kwargs(retry), **read_csv_kwargs), retry
+        except Exception:
+            continue
+    return None, None
+
+
+def read_csv_arrow(data, dialect=None):
+    """
+    Parse CSV bytes with pyarrow's multithreaded reader. Text columns come back
+    as Arrow-backed strings, numbers and ISO timestamps as numpy dtypes.
+    newlines_in_values slows the parallel parse down, so it is only turned on
+    when the sniffed sample has a quoted newline, or to retry a failed parse.
+    Returns (df, dialect); raises if pyarrow can't read the file, or a column
+    isn't valid text in the sniffed encoding.
+    """
+    dialect = dict(dialect or sniff_csv(data))
+    read_options = pa_csv.ReadOptions(use_threads=True, skip_rows=dialect['header_row'],
+                                      encoding=dialect['encoding'].replace('utf-8-sig', 'utf8'))
+
+    def read(newlines_in_values):
+        parse_options = pa_csv.ParseOptions(delimiter=dialect['delimiter'], quote_char=dialect['quotechar'],
+                                            newlines_in_values=newlines_in_values)
+        return pa_csv.read_csv(pa.BufferReader(data), read_options=read_options, parse_options=parse_options)
+
+    if dialect.get('quoted_newlines'):
+        table = read(True)
+    else:
+        try:
+            table = read(False)
+        except pa.ArrowInvalid:
+            # A quoted newline past the sniffed sample
+            table = read(True)
+            dialect['quoted_newlines'] = True
+    # Bytes that aren't valid in the sniffed encoding past the sample turn a
+    # text column into raw binary instead of failing the read
+    binary = [field.name for field in table.schema
+              if pa.types.is_binary(field.type) or pa.types.is_large_binary(field.type)]
+    if binary:
+        raise ValueError(f"Column(s) {', '.join(binary)} are not valid {dialect['encoding']}")
+    df = table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow'),
+                                       pa.large_string(): pd.StringDtype('pyarrow')}.get)
+    dialect['engine'] = 'pyarrow'
+    return df, dialect
+
+
+def _dialect_kwargs(dialect):
+    return {'encoding': dialect['encoding'], 'sep': dialect['delimiter'],
+            'quotechar': dialect['quotechar'], 'skiprows': dialect['header_row'] or None}
+
+
+def describe_dialect(dialect):
+    """
+    Short text for the upload banner, e.g. "cp1252 • ';' • header row 2"
+    """
+    if not dialect:
+        return ''
+    delimiter = {'\t': 'tab'}.get(dialect['delimiter'], f"'{dialect['delimiter']}'")
+    text = f"{dialect['encoding']} • {delimiter}"
+    if dialect.get('header_row'):
+        text += f" • header row {dialect['header_row'] + 1}"
+    if dialect.get('engine') == 'pyarrow':
+        text += " • pyarrow"
+    return text
+
+
+def stream_csv_to_monthly(data):
+    """
+    Chunked monthly aggregation of CSV bytes; returns (monthly, info, dialect)
+    """
+    dialect = sniff_csv(data)
+    try:
+        monthly, info = model.stream_preprocess_csv(BytesIO(data), **_dialect_kwargs(dialect))
+        return monthly, info, dialect
+    except Exception as e:
+        print(f"⚠️ Sniffed dialect {describe_dialect(dialect)} failed ({e}); trying other encodings")
+    for encoding in fallback_encodings(dialect['encoding']):
+        retry = dict(dialect, encoding=encoding, confidence=0.0)
+        try:
+            monthly, info = model.stream_preprocess_csv(BytesIO(data), **_dialect_kwargs(retry))
+            return monthly, info, retry
+        except Exception:
+            continue
+    return None, None, None
+
+
+def parse_upload(name, data, engine='pandas'):
+    """
+    Read CSV / Excel / JSON bytes into a DataFrame; returns (df, dialect)
+    (dialect is None for Excel / JSON). engine='pyarrow' reads CSVs with
+    read_csv_arrow, falling back to the pandas parser if that fails.
+    """
+    extension = os.path.splitext(name)[1].lower()
+    if extension == '.csv':
+        if engine == 'pyarrow' and ARROW_AVAILABLE:
+            dialect = sniff_csv(data)
+            try:
+                return read_csv_arrow(data, dialect)
+            except Exception as e:
+                print(f"⚠️ pyarrow could not parse {name} ({e}); using the standard parser")
+        return read_csv_sniffed(data)
+    if extension in ('.xlsx', '.xls'):
+        return pd.read_excel(BytesIO(data)), None
+    if extension == '.json':
+        return pd.read_json(BytesIO(data)), None
+    return None, None
+
+
+def _entry_bytes(entry):
+    frame = entry.get('df') if entry.get('df') is not None else entry.get('monthly')
+    return int(frame.memory_usage(index=True).sum()) if frame is not None else 0
+
+
+def _build_entry(name, data, clean, mode, engine):
+    start = time.perf_counter()
+    if mode == 'stream':
+        monthly, info, dialect = stream_csv_to_monthly(data)
+        entry = {'monthly': monthly, 'info': info, 'dialect': dialect, 'df': None, 'cleaning_actions': []}
+    else:
+        df, dialect = parse_upload(name, data, engine)
+        cleaning_actions = []
+        if df is not None and clean is not None:
+            df, cleaning_actions = clean(df)
+        entry = {'df': df, 'dialect': dialect, 'cleaning_actions': cleaning_actions,
+                 'monthly': None, 'info': None}
+    entry['seconds'] = time.perf_counter() - start
+    return entry
+
+
+def _caller_copy(entry, **extra):
+    """
+    entry with its own (shallow, copy-on-write) copies of the cached frames:
+    the data is shared until a session changes its frame, which then can't
+    change what other sessions get from the cache
+    """
+    copied = {**entry, **extra, 'cleaning_actions': list(entry.get('cleaning_actions') or [])}
+    for field in ('df', 'monthly'):
+        if copied.get(field) is not None:
+            copied[field] = copied[field].copy(deep=False)
+    return copied
+
+
+def ingest_upload(name, data, clean=None, fingerprint=None, mode='table', engine='pandas'):
+    """
+    Parsed (and cleaned) upload, built once per distinct file content.
+    data is the file bytes, or a callable returning them (only called on a miss
+    or when no fingerprint is given). mode='table' parses and runs clean(df);
+    mode='stream' aggregates a CSV straight into monthly totals.
+    engine='pyarrow' opts in to the multithreaded Arrow CSV reader.
+    Returns a dict with df / monthly / info / dialect / cleaning_actions,
+    plus 'fingerprint' and 'cached'. The frames are the caller's own copy-on-write copies.
+    """
+    if fingerprint is None:
+        data = data() if callable(data) else data
+        fingerprint = fingerprint_bytes(data)
+    key = (fingerprint, mode, os.path.splitext(name)[1].lower(), engine)
+
+    # key -> [lock, sessions holding or waiting for it]; dropped when the last one leaves
+    with _upload_cache_lock:
+        key_lock = _key_locks.setdefault(key, [threading.Lock(), 0])
+        key_lock[1] += 1
+
+    # One session parses a given file; others uploading it meanwhile wait for it
+    try:
+        with key_lock[0]:
+            with _upload_cache_lock:
+                entry = _upload_cache.get(key)
+                if entry is not None:
+                    _upload_cache.move_to_end(key)
+                    upload_cache_stats['hits'] += 1
+                    upload_cache_stats['seconds_saved'] += entry['seconds']
+                    return _caller_copy(entry, fingerprint=fingerprint, cached=True)
+
+            data = data() if callable(data) else data
+            entry = _build_entry(name, data, clean, mode, engine)
+            _store_entry(key, entry)
+    finally:
+        with _upload_cache_lock:
+            key_lock[1] -= 1
+            if key_lock[1] == 0:
+                _key_locks.pop(key, None)
+
+    return _caller_copy(entry, fingerprint=fingerprint, cached=False)
+
+
+def _store_entry(key, entry):
+    with _upload_cache_lock:
+        upload_cache_stats['misses'] += 1
+        if entry['df'] is not None or entry['monthly'] is not None:
+            entry['bytes'] = _entry_bytes(entry)
+            _upload_cache[key] = entry
+            total = sum(e['bytes'] for e in _upload_cache.values())
+            while len(_upload_cache) > 1 and (len(_upload_cache) > UPLOAD_CACHE_SIZE
+                                              or total > UPLOAD_CACHE_MAX_BYTES):
+                _, evicted = _upload_cache.popitem(last=False)
+                total -= evicted['bytes']
+
+
+def clear_upload_cache():
+    with _upload_cache_lock:
+        _upload_cache.clear()
+
+
+# ===== SAMPLE DATASET =====
+# The cleaned sample is built once per process (or read back from a parquet
+# file next to the CSV) and every session gets a copy-on-write view of it.
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'Sample - Superstore.csv')
+SAMPLE_PARQUET = os.path.splitext(SAMPLE_CSV)[0] + '.cleaned.parquet'
+SAMPLE_PREWARM_MODELS = ['linear', 'polynomial', 'random', 'gradient']
+SAMPLE_PREWARM_MONTHS = 6   # the sidebar's default horizon
+_sample = None
+_sample_lock = threading.Lock()
+
+
+def _sample_fingerprint():
+    stat = os.stat(SAMPLE_CSV)
+    return f"sample:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def _read_sample_parquet(fingerprint):
+    if not os.path.exists(SAMPLE_PARQUET) or os.path.getmtime(SAMPLE_PARQUET) < os.path.getmtime(SAMPLE_CSV):
+        return None
+    try:
+        df = pd.read_parquet(SAMPLE_PARQUET)
+        if df.attrs.get('fingerprint') != fingerprint:
+            return None
+        return df, list(df.attrs.get('cleaning_actions', []))
+    except Exception as e:
+        print(f"⚠️ Could not read {SAMPLE_PARQUET}: {e}")
+        return None
+
+
+def _write_sample_parquet(df, cleaning_actions, fingerprint):
+    try:
+        df = df.copy(deep=False)
+        df.attrs = {'fingerprint': fingerprint, 'cleaning_actions': list(cleaning_actions)}
+        tmp = f"{SAMPLE_PARQUET}.tmp"
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, SAMPLE_PARQUET)
+    except Exception as e:
+        print(f"⚠️ Could not write {SAMPLE_PARQUET}: {e}")
+
+
+def load_sample(clean):
+    """
+    Cleaned sample dataset, built once for the whole process:
+    {'df', 'cleaning_actions', 'fingerprint'} with the caller's own copy-on-write frame
+    """
+    global _sample
+    if _sample is not None:
+        return _caller_copy(_sample)
+    with _sample_lock:
+        if _sample is not None:
+            return _caller_copy(_sample)
+        fingerprint = _sample_fingerprint()
+        cached = _read_sample_parquet(fingerprint)
+        if cached is not None:
+            df, cleaning_actions = cached
+        else:
+            df = None
+            for encoding in ('latin-1', 'utf-8'):
+                try:
+                    df = pd.read_csv(SAMPLE_CSV, encoding=encoding)
+                    break
+                except Exception:
+                    continue
+            if df is None:
+                raise ValueError(f"Could not read {SAMPLE_CSV}")
+            df, cleaning_actions = clean(df)
+            _write_sample_parquet(df, cleaning_actions, fingerprint)
+        _sample = {'df': df, 'cleaning_actions': cleaning_actions, 'fingerprint': fingerprint}
+        return _caller_copy(_sample)
+
+
+def prewarm_sample(clean, model_types=None, strategy='recursive'):
+    """
+    Load the sample, build its monthly series and cache the default models'
+    forecast paths, so the first demo user finds everything ready
+    """
+    start = time.perf_counter()
+    try:
+        sample = load_sample(clean)
+        monthly = model.load_and_preprocess_data(sample['df'], fingerprint=sample['fingerprint'])
+        for model_type in model_types or SAMPLE_PREWARM_MODELS:
+            try:
+                model.forecast_path(monthly, model_type, SAMPLE_PREWARM_MONTHS, strategy=strategy)
+            except Exception as e:
+                print(f"⚠️ Sample prewarm of {model_type} failed: {e}")
+        print(f"✅ Sample data prewarmed in {time.perf_counter() - start:.1f}s")
+    except Exception as e:
+        print(f"⚠️ Sample prewarm failed: {e}")
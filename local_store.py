@@ -0,0 +1,280 @@
+"""
+LOCAL STORE - SQLITE PERSISTENCE
+Users • Forecast Records • One-shot users.json Import
+Used when Firebase is not available
+"""
+
+import sqlite3
+import json
+import os
+import threading
+
+LOCAL_DB_PATH = os.environ.get('FORECASTPRO_DB', 'forecastpro.db')
+JSON_IMPORT_FILES = ('users.json', 'users.json.backup')
+BUSY_TIMEOUT_MS = 30000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username  TEXT PRIMARY KEY,
+    email_key TEXT UNIQUE,
+    data      TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS forecasts (
+    username TEXT NOT NULL,
+    id       TEXT NOT NULL,
+    data     TEXT NOT NULL,
+    PRIMARY KEY (username, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# ===== CONNECTIONS =====
+# One connection per thread (Streamlit runs each session on its own thread).
+# WAL lets readers and a writer work at the same time; writers wait on the
+# busy timeout instead of failing.
+_thread_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+def get_connection(path=None):
+    """
+    Connection for the calling thread (autocommit; use transaction() for writes)
+    """
+    path = path or LOCAL_DB_PATH
+    connections = _thread_local.__dict__.setdefault('connections', {})
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        with _schema_lock:
+            if path not in _schema_ready:
+                conn.executescript(_SCHEMA)
+                _schema_ready.add(path)
+        connections[path] = conn
+    return conn
+
+class transaction:
+    """
+    BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block of statements
+    """
+    def __init__(self, path=None):
+        self.conn = get_connection(path)
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+def _email_key(user_data):
+    email = (user_data or {}).get('email')
+    return email.strip().lower() if email else None
+
+# ===== USERS =====
+def get_user(username, path=None):
+    """
+    Single user profile, or None
+    """
+    row = get_connection(path).execute(
+        "SELECT data FROM users WHERE username = ?", (username,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def get_username_by_email(email_key, path=None):
+    """
+    Owner of a normalized email, or None
+    """
+    row = get_connection(path).execute(
+        "SELECT username FROM users WHERE email_key = ?", (email_key,)).fetchone()
+    return row[0] if row else None
+
+def load_users(path=None):
+    """
+    All user profiles as {username: data}
+    """
+    rows = get_connection(path).execute("SELECT username, data FROM users").fetchall()
+    return {username: json.loads(data) for username, data in rows}
+
+def _upsert_user(conn, username, user_data):
+    conn.execute(
+        "INSERT INTO users (username, email_key, data) VALUES (?, ?, ?) "
+        "ON CONFLICT(username) DO UPDATE SET email_key = excluded.email_key, data = excluded.data",
+        (username, _email_key(user_data), json.dumps(user_data)))
+
+def _merge_user(conn, username, fields=None, drop=()):
+    """
+    Merge fields into (and drop fields from) a profile row; returns the profile.
+    email_key is only recomputed when the email itself changes, so an account
+    indexed without one (it shares its email, see import_json_users) can
+    still be updated.
+    """
+    row = conn.execute("SELECT data FROM users WHERE username = ?", (username,)).fetchone()
+    old = json.loads(row[0]) if row else None
+    user_data = {**(old or {}), **(fields or {})}
+    for field in drop:
+        user_data.pop(field, None)
+    if old is None:
+        _upsert_user(conn, username, user_data)
+    elif _email_key(old) != _email_key(user_data):
+        conn.execute("UPDATE users SET email_key = ?, data = ? WHERE username = ?",
+                     (_email_key(user_data), json.dumps(user_data), username))
+    else:
+        conn.execute("UPDATE users SET data = ? WHERE username = ?", (json.dumps(user_data), username))
+    return user_data
+
+def save_users(users, path=None):
+    """
+    Merge the given profiles into their rows (one transaction)
+    """
+    with transaction(path) as conn:
+        for username, user_data in users.items():
+            _merge_user(conn, username, user_data)
+    return True
+
+def update_user(username, fields, path=None):
+    """
+    Merge fields into one profile; returns the updated profile
+    """
+    with transaction(path) as conn:
+        return _merge_user(conn, username, fields)
+
+def remove_user_fields(username, fields, path=None):
+    """
+    Drop fields from one profile
+    """
+    with transaction(path) as conn:
+        if conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone():
+            _merge_user(conn, username, drop=fields)
+
+def create_user(username, user_data, path=None):
+    """
+    Insert a new user; returns None, or the reason it was rejected
+    """
+    try:
+        with transaction(path) as conn:
+            if conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone():
+                return "Username already exists"
+            email_key = _email_key(user_data)
+            if email_key and conn.execute("SELECT 1 FROM users WHERE email_key = ?", (email_key,)).fetchone():
+                return "Email already registered"
+            _upsert_user(conn, username, user_data)
+        return None
+    except sqlite3.IntegrityError:
+        return "Email already registered"
+
+def delete_user(username, path=None):
+    """
+    Delete a user and all of its forecasts
+    """
+    with transaction(path) as conn:
+        conn.execute("DELETE FROM forecasts WHERE username = ?", (username,))
+        conn.execute("DELETE FROM users WHERE username = ?", (username,))
+
+# ===== FORECASTS =====
+def add_forecasts(username, records, path=None):
+    """
+    Insert forecast records (each must carry an 'id')
+    """
+    with transaction(path) as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO forecasts (username, id, data) VALUES (?, ?, ?)",
+            [(username, record['id'], json.dumps(record)) for record in records])
+
+def add_forecast(username, record, profile_updates=None, path=None):
+    """
+    Insert one forecast record and merge profile_updates into its owner's
+    profile, in one transaction
+    """
+    with transaction(path) as conn:
+        conn.execute("INSERT OR REPLACE INTO forecasts (username, id, data) VALUES (?, ?, ?)",
+                     (username, record['id'], json.dumps(record)))
+        if profile_updates:
+            _merge_user(conn, username, profile_updates)
+
+def delete_forecast(username, forecast_id, path=None):
+    """
+    Delete one forecast record
+    """
+    get_connection(path).execute(
+        "DELETE FROM forecasts WHERE username = ? AND id = ?", (username, forecast_id))
+
+def clear_forecasts(username, path=None):
+    """
+    Delete every forecast record of a user
+    """
+    get_connection(path).execute("DELETE FROM forecasts WHERE username = ?", (username,))
+
+def count_forecasts(username, path=None):
+    """
+    Number of forecast records of a user
+    """
+    return get_connection(path).execute(
+        "SELECT COUNT(*) FROM forecasts WHERE username = ?", (username,)).fetchone()[0]
+
+def forecast_page(username, cursor=None, limit=5, path=None):
+    """
+    Up to limit records, newest id first, with ids below cursor
+    """
+    query = "SELECT data FROM forecasts WHERE username = ?"
+    args = [username]
+    if cursor:
+        query += " AND id < ?"
+        args.append(cursor)
+    query += " ORDER BY id DESC LIMIT ?"
+    args.append(limit)
+    return [json.loads(data) for (data,) in get_connection(path).execute(query, args)]
+
+# ===== ONE-SHOT JSON IMPORT =====
+def import_json_users(files=JSON_IMPORT_FILES, path=None):
+    """
+    Copy users (and their forecast_history) from the first users.json /
+    users.json.backup found into the database. Runs once per database;
+    returns the number of users imported.
+    """
+    from storage import legacy_forecast_records  # storage imports this module
+    conn = get_connection(path)
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+        return 0
+
+    source = next((f for f in files if os.path.exists(f)), None)
+    users = {}
+    if source:
+        try:
+            with open(source, 'r') as f:
+                users = json.load(f)
+        except Exception as e:
+            print(f"❌ Could not read {source}: {e}")
+            return 0
+
+    seen_emails = set()
+    with transaction(path) as conn:
+        # Re-checked under the write lock: another process may have imported meanwhile
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+            return 0
+        for username, user_data in users.items():
+            user_data = dict(user_data)
+            history = user_data.pop('forecast_history', None) or []
+            email_key = _email_key(user_data)
+            if email_key in seen_emails:
+                print(f"⚠️ {username}: email already used by another account, not indexed")
+                email_key = None
+            elif email_key:
+                seen_emails.add(email_key)
+            conn.execute("INSERT OR IGNORE INTO users (username, email_key, data) VALUES (?, ?, ?)",
+                         (username, email_key, json.dumps(user_data)))
+            
+            records = legacy_forecast_records(history)
+            conn.executemany("INSERT OR IGNORE INTO forecasts (username, id, data) VALUES (?, ?, ?)",
+                             [(username, record['id'], json.dumps(record)) for record in records])
+        conn.execute("INSERT INTO meta (key, value) VALUES ('json_imported', ?)", (source or '',))
+
+    if users:
+        print(f"✅ Imported {len(users)} users from {source} into {path or LOCAL_DB_PATH}")
+    return len(users)
@@ -0,0 +1,236 @@
+"""
+BULK MIGRATION - users.json → FIRESTORE
+Bounded Batches • Concurrent Commits • Checkpoint/Resume • Throughput Report
+
+Usage: python migrate.py [users.json] [--key firebase-key.json] [--batch-size 400]
+                         [--parallelism 8] [--checkpoint .migration_checkpoint.json]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from storage import legacy_forecast_records, normalize_email
+
+MAX_BATCH_OPS = 500          # Firestore limit per batch
+DEFAULT_BATCH_SIZE = 400
+DEFAULT_PARALLELISM = 8
+DEFAULT_CHECKPOINT = '.migration_checkpoint.json'
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.5          # seconds, doubled on every retry
+
+
+def duplicate_emails(users):
+    """
+    Emails used by more than one account: {email: [usernames, sorted]}
+    """
+    owners = {}
+    for username in sorted(users):
+        email = users[username].get('email')
+        if email:
+            owners.setdefault(normalize_email(email), []).append(username)
+    return {email: names for email, names in owners.items() if len(names) > 1}
+
+
+def plan_writes(users):
+    """
+    Every document write of the migration, in a stable order:
+    users/{u}, user_emails/{email} and users/{u}/forecasts/{id}
+    (forecast_history becomes one record per forecast).
+    A duplicate email is indexed for the first of its accounts only
+    (see duplicate_emails); the others keep their profile but aren't indexed.
+    """
+    duplicates = duplicate_emails(users)
+    writes = []
+    for username in sorted(users):
+        user_data = dict(users[username])
+        history = user_data.pop('forecast_history', None) or []
+        if history:
+            user_data['forecast_count'] = max(int(user_data.get('forecast_count', 0) or 0), len(history))
+        writes.append((('users', username), user_data))
+        if user_data.get('email'):
+            email = normalize_email(user_data['email'])
+            if duplicates.get(email, [username])[0] == username:
+                writes.append((('user_emails', email), {'username': username}))
+        for record in legacy_forecast_records(history):
+            writes.append((('users', username, 'forecasts', record['id']), record))
+    return writes
+
+
+def plan_batches(writes, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Split writes into batches of at most batch_size operations
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_OPS))
+    return [writes[start:start + batch_size] for start in range(0, len(writes), batch_size)]
+
+
+def source_fingerprint(users, batch_size):
+    """
+    Identifies a plan, so a checkpoint is only reused for the same input
+    """
+    h = hashlib.sha1(json.dumps(users, sort_keys=True, default=str).encode())
+    h.update(str(batch_size).encode())
+    return h.hexdigest()
+
+
+# ===== CHECKPOINT =====
+def load_checkpoint(path, fingerprint):
+    """
+    Indices of batches already committed for this plan
+    """
+    if not path or not os.path.exists(path):
+        return set()
+    try:
+        with open(path, 'r') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('fingerprint') == fingerprint:
+            return set(checkpoint.get('done', []))
+        print("⚠️ Checkpoint is for a different users.json or batch size - starting over")
+    except Exception as e:
+        print(f"⚠️ Could not read checkpoint {path}: {e}")
+    return set()
+
+
+def save_checkpoint(path, fingerprint, done, total):
+    """
+    Atomically record committed batches
+    """
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump({'fingerprint': fingerprint, 'done': sorted(done), 'total': total}, f)
+    os.replace(tmp, path)
+
+
+# ===== MIGRATION =====
+def _document(db, path):
+    ref = db.collection(path[0]).document(path[1])
+    for i in range(2, len(path), 2):
+        ref = ref.collection(path[i]).document(path[i + 1])
+    return ref
+
+
+def _commit_batch(db, writes, max_retries, retry_backoff):
+    for attempt in range(max_retries + 1):
+        try:
+            batch = db.batch()
+            for path, data in writes:
+                batch.set(_document(db, path), data)
+            batch.commit()
+            return
+        except Exception:
+            if attempt == max_retries:
+                raise
+            time.sleep(retry_backoff * (2 ** attempt))
+
+
+def migrate_users(db, users, batch_size=DEFAULT_BATCH_SIZE, parallelism=DEFAULT_PARALLELISM,
+                  checkpoint_path=DEFAULT_CHECKPOINT, progress=None,
+                  max_retries=MAX_RETRIES, retry_backoff=RETRY_BACKOFF):
+    """
+    Write users (and their forecast histories) to Firestore in bounded batches
+    committed by parallelism threads. Committed batches are checkpointed, so a
+    re-run skips them; every write is an idempotent set, so retrying is safe.
+    progress(done_batches, total_batches) is called as batches finish.
+    Returns a report dict (counts, failures, duplicate emails, seconds, documents/s).
+    """
+    start = time.perf_counter()
+    duplicates = duplicate_emails(users)
+    for email, names in duplicates.items():
+        print(f"⚠️ {email} is used by {', '.join(names)} - only {names[0]} is indexed")
+    writes = plan_writes(users)
+    batches = plan_batches(writes, batch_size)
+    fingerprint = source_fingerprint(users, batch_size)
+    done = load_checkpoint(checkpoint_path, fingerprint)
+    todo = [i for i in range(len(batches)) if i not in done]
+    skipped = len(batches) - len(todo)
+
+    lock = threading.Lock()
+    failed = {}
+    written = 0
+    if progress:
+        progress(len(done), len(batches))
+
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+        futures = {pool.submit(_commit_batch, db, batches[i], max_retries, retry_backoff): i for i in todo}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failed[index] = str(e)
+                print(f"❌ Batch {index} failed after {max_retries + 1} attempts: {e}")
+                continue
+            with lock:
+                done.add(index)
+                written += len(batches[index])
+                save_checkpoint(checkpoint_path, fingerprint, done, len(batches))
+            if progress:
+                progress(len(done), len(batches))
+
+    seconds = time.perf_counter() - start
+    if not failed and checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return {
+        'users': len(users),
+        'documents': len(writes),
+        'written': written,
+        'batches': len(batches),
+        'skipped_batches': skipped,
+        'failed_batches': sorted(failed),
+        'duplicate_emails': duplicates,
+        'seconds': seconds,
+        'docs_per_second': written / seconds if seconds > 0 else 0.0,
+    }
+
+
+def format_report(report):
+    """
+    One-line summary of migrate_users' report
+    """
+    text = (f"{report['users']} users, {report['written']}/{report['documents']} documents in "
+            f"{report['batches'] - report['skipped_batches']} batches "
+            f"({report['skipped_batches']} resumed from checkpoint) - "
+            f"{report['seconds']:.1f}s, {report['docs_per_second']:,.0f} docs/s")
+    if report.get('duplicate_emails'):
+        text += f" - {len(report['duplicate_emails'])} emails shared by several accounts (only the first is indexed)"
+    if report['failed_batches']:
+        text += f" - {len(report['failed_batches'])} batches failed, re-run to resume"
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate users.json to Firestore")
+    parser.add_argument('source', nargs='?', default='users.json')
+    parser.add_argument('--key', default='firebase-key.json', help="Service account key file")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--parallelism', type=int, default=DEFAULT_PARALLELISM)
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+    args = parser.parse_args()
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(args.key))
+    db = firestore.client()
+
+    with open(args.source, 'r') as f:
+        users = json.load(f)
+
+    def show(done, total):
+        print(f"\r📦 {done}/{total} batches", end='', flush=True)
+
+    report = migrate_users(db, users, args.batch_size, args.parallelism, args.checkpoint, progress=show)
+    print()
+    print(("✅ " if not report['failed_batches'] else "⚠️ ") + format_report(report))
+    return 1 if report['failed_batches'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
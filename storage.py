@@ -0,0 +1,546 @@
+"""
+STORAGE BACKENDS - USERS & FORECAST RECORDS
+Firestore • Local SQLite • In-Memory
+Every backend records per-operation call counts, latencies and document reads/writes
+"""
+
+import copy
+import functools
+from abc import ABC, abstractmethod
+import threading
+import time
+from datetime import datetime
+
+import local_store
+
+try:
+    from firebase_admin import firestore
+except Exception:
+    firestore = None
+
+FIRESTORE_BATCH_OPS = 400   # Firestore allows 500 writes per batch
+
+
+def normalize_email(email):
+    """
+    Key used by the email uniqueness index
+    """
+    return email.strip().lower()
+
+
+def legacy_forecast_records(history):
+    """
+    forecast_history entries as forecast records. Entries without an id get a
+    deterministic one (their 'date' plus position, as wide as new ids), so
+    every migration path gives a record the same id and order.
+    """
+    records = []
+    for i, forecast in enumerate(history):
+        if not forecast.get('id'):
+            try:
+                stamp = datetime.strptime(str(forecast.get('date')), '%Y-%m-%d %H:%M').strftime('%Y%m%d%H%M%S')
+            except ValueError:
+                stamp = '0' * 14
+            forecast = dict(forecast, id=f"{stamp}{i:06d}_legacy")
+        records.append(forecast)
+    return records
+
+
+def measured(method):
+    """
+    Record calls, latency and the document reads/writes counted by the method.
+    Only outermost calls are recorded: a measured method called from another
+    one counts towards its caller, so latency isn't counted twice.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        counters = self._local.__dict__.setdefault('stack', [])
+        if counters:
+            return method(self, *args, **kwargs)
+        counters.append({'reads': 0, 'writes': 0})
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            counted = counters.pop()
+            self._record(method.__name__, elapsed, counted['reads'], counted['writes'])
+    return wrapper
+
+
+class StorageBackend(ABC):
+    """
+    Interface of a user/forecast store. Profiles are dicts keyed by username;
+    forecast records are dicts with a time-sortable 'id'.
+    """
+    name = 'base'
+
+    def __init__(self):
+        self._local = threading.local()
+        self._metrics_lock = threading.Lock()
+        self.metrics = {}
+
+    # ----- metrics -----
+    def _count(self, reads=0, writes=0):
+        stack = self._local.__dict__.get('stack')
+        if stack:
+            stack[-1]['reads'] += reads
+            stack[-1]['writes'] += writes
+
+    def _record(self, op, seconds, reads, writes):
+        with self._metrics_lock:
+            entry = self.metrics.setdefault(op, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                                 'reads': 0, 'writes': 0})
+            entry['calls'] += 1
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+            entry['reads'] += reads
+            entry['writes'] += writes
+
+    def snapshot(self):
+        """
+        Copy of the metrics, e.g. to diff around one user action
+        """
+        with self._metrics_lock:
+            return copy.deepcopy(self.metrics)
+
+    def reset_metrics(self):
+        with self._metrics_lock:
+            self.metrics = {}
+
+    def metrics_table(self, since=None):
+        """
+        One row per operation (calls, reads, writes, mean/max latency in ms),
+        optionally relative to an earlier snapshot
+        """
+        rows = []
+        for op, entry in sorted(self.snapshot().items()):
+            base = (since or {}).get(op, {'calls': 0, 'seconds': 0.0, 'reads': 0, 'writes': 0})
+            calls = entry['calls'] - base['calls']
+            if calls <= 0:
+                continue
+            rows.append({'operation': op, 'calls': calls,
+                         'reads': entry['reads'] - base['reads'],
+                         'writes': entry['writes'] - base['writes'],
+                         'mean_ms': (entry['seconds'] - base['seconds']) / calls * 1000,
+                         'max_ms': entry['max_seconds'] * 1000})
+        return rows
+
+    def flush(self, timeout=10, username=None):
+        """
+        Wait for deferred writes, only username's if given
+        (backends that defer them override this)
+        """
+        return True
+
+    # ----- users -----
+    @abstractmethod
+    def load_users(self):
+        pass
+
+    @abstractmethod
+    def save_users(self, users):
+        pass
+
+    @abstractmethod
+    def get_user(self, username):
+        pass
+
+    @abstractmethod
+    def update_user(self, username, fields):
+        pass
+
+    @abstractmethod
+    def create_user(self, username, user_data):
+        pass
+
+    @abstractmethod
+    def delete_user(self, username):
+        pass
+
+    # ----- forecasts -----
+    @abstractmethod
+    def add_forecast(self, username, record, profile_updates=None):
+        pass
+
+    @abstractmethod
+    def delete_forecast(self, username, forecast_id):
+        pass
+
+    @abstractmethod
+    def clear_forecasts(self, username):
+        pass
+
+    @abstractmethod
+    def count_forecasts(self, username, user_data=None):
+        pass
+
+    @abstractmethod
+    def forecast_page(self, username, cursor=None, limit=5):
+        pass
+
+    @abstractmethod
+    def migrate_forecast_history(self, username, records):
+        pass
+
+
+# ===== FIRESTORE =====
+class FirestoreBackend(StorageBackend):
+    """
+    users/{username}, user_emails/{email} and users/{username}/forecasts/{id}.
+    Writes that don't need an answer go through the write-behind queue.
+    """
+    name = 'firestore'
+
+    def __init__(self, get_client, write_queue):
+        super().__init__()
+        self.get_client = get_client
+        self.write_queue = write_queue
+
+    def _users(self):
+        return self.get_client().collection('users')
+
+    def _user_path(self, username):
+        return f"users/{username}"
+
+    def flush(self, timeout=10, username=None):
+        return self.write_queue.flush(timeout, prefix=self._user_path(username) if username else None)
+
+    @measured
+    def load_users(self):
+        users = {doc.id: doc.to_dict() for doc in self._users().stream()}
+        self._count(reads=max(len(users), 1))
+        return users
+
+    @measured
+    def save_users(self, users):
+        db = self.get_client()
+        names = list(users)
+        for start in range(0, len(names), FIRESTORE_BATCH_OPS):
+            batch = db.batch()
+            for username in names[start:start + FIRESTORE_BATCH_OPS]:
+                batch.set(self._users().document(username), users[username], merge=True)
+            batch.commit()
+        self._count(writes=len(names))
+        return True
+
+    @measured
+    def get_user(self, username):
+        doc = self._users().document(username).get()
+        self._count(reads=1)
+        return doc.to_dict() if doc.exists else None
+
+    @measured
+    def update_user(self, username, fields):
+        self.write_queue.set(self._users().document(username), fields, merge=True)
+        self._count(writes=1)
+
+    @measured
+    def create_user(self, username, user_data):
+        db = self.get_client()
+        user_ref = self._users().document(username)
+        email_ref = db.collection('user_emails').document(normalize_email(user_data['email']))
+
+        # Accounts created before the index existed (single-field indexed query)
+        self._count(reads=1)
+        if self._users().where('email', '==', user_data['email']).limit(1).get():
+            return "Email already registered"
+
+        @firestore.transactional
+        def create_in_transaction(transaction):
+            self._count(reads=2)
+            if user_ref.get(transaction=transaction).exists:
+                return "Username already exists"
+            if email_ref.get(transaction=transaction).exists:
+                return "Email already registered"
+            transaction.set(user_ref, user_data)
+            transaction.set(email_ref, {'username': username})
+            self._count(writes=2)
+            return None
+
+        return create_in_transaction(db.transaction())
+
+    @measured
+    def delete_user(self, username):
+        self.write_queue.flush(prefix=self._user_path(username))
+        db = self.get_client()
+        user_ref = self._users().document(username)
+        doc = user_ref.get()
+        self._count(reads=1)
+        email = (doc.to_dict() or {}).get('email') if doc.exists else None
+        batch = db.batch()
+        batch.delete(user_ref)
+        if email:
+            batch.delete(db.collection('user_emails').document(normalize_email(email)))
+        batch.commit()
+        self._count(writes=2 if email else 1)
+
+    @measured
+    def add_forecast(self, username, record, profile_updates=None):
+        user_ref = self._users().document(username)
+        self.write_queue.set(user_ref.collection('forecasts').document(record['id']), record)
+        self.write_queue.set(user_ref, {**(profile_updates or {}), 'forecast_count': firestore.Increment(1)},
+                             merge=True)
+        self._count(writes=2)
+
+    @measured
+    def delete_forecast(self, username, forecast_id):
+        # The record may still be queued; and forecast_count must only drop when
+        # this call removes it (double clicks, two sessions deleting the same one)
+        self.write_queue.flush(prefix=self._user_path(username))
+        db = self.get_client()
+        user_ref = self._users().document(username)
+        record_ref = user_ref.collection('forecasts').document(forecast_id)
+
+        @firestore.transactional
+        def delete_in_transaction(transaction):
+            self._count(reads=1)
+            if not record_ref.get(transaction=transaction).exists:
+                return False
+            transaction.delete(record_ref)
+            transaction.set(user_ref, {'forecast_count': firestore.Increment(-1)}, merge=True)
+            self._count(writes=2)
+            return True
+
+        return delete_in_transaction(db.transaction())
+
+    @measured
+    def clear_forecasts(self, username):
+        self.write_queue.flush(prefix=self._user_path(username))
+        db = self.get_client()
+        user_ref = self._users().document(username)
+        while True:
+            docs = list(user_ref.collection('forecasts').limit(FIRESTORE_BATCH_OPS).stream())
+            self._count(reads=max(len(docs), 1))
+            if not docs:
+                break
+            batch = db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            batch.commit()
+            self._count(writes=len(docs))
+        user_ref.set({'forecast_count': 0}, merge=True)
+        self._count(writes=1)
+
+    @measured
+    def count_forecasts(self, username, user_data=None):
+        if user_data is None:
+            user_data = self.get_user(username) or {}
+        return int(user_data.get('forecast_count', 0) or 0)
+
+    @measured
+    def forecast_page(self, username, cursor=None, limit=5):
+        # Read our own queued writes
+        self.write_queue.flush(timeout=5, prefix=self._user_path(username))
+        query = (self._users().document(username).collection('forecasts')
+                 .order_by('id', direction=firestore.Query.DESCENDING))
+        if cursor:
+            query = query.start_after({'id': cursor})
+        records = [doc.to_dict() for doc in query.limit(limit).stream()]
+        self._count(reads=max(len(records), 1))
+        return records
+
+    @measured
+    def migrate_forecast_history(self, username, records):
+        self.write_queue.flush(prefix=self._user_path(username))
+        db = self.get_client()
+        user_ref = self._users().document(username)
+        for start in range(0, len(records), FIRESTORE_BATCH_OPS):
+            batch = db.batch()
+            for record in records[start:start + FIRESTORE_BATCH_OPS]:
+                batch.set(user_ref.collection('forecasts').document(record['id']), record)
+            batch.commit()
+        user_ref.update({'forecast_history': firestore.DELETE_FIELD})
+        self._count(writes=len(records) + 1)
+
+
+# ===== LOCAL SQLITE =====
+class LocalBackend(StorageBackend):
+    """
+    The SQLite store in local_store (one row per user and per forecast)
+    """
+    name = 'local'
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path
+
+    @measured
+    def load_users(self):
+        users = local_store.load_users(self.path)
+        self._count(reads=len(users))
+        return users
+
+    @measured
+    def save_users(self, users):
+        local_store.save_users(users, self.path)
+        self._count(reads=len(users), writes=len(users))
+        return True
+
+    @measured
+    def get_user(self, username):
+        self._count(reads=1)
+        return local_store.get_user(username, self.path)
+
+    @measured
+    def update_user(self, username, fields):
+        local_store.update_user(username, fields, self.path)
+        self._count(reads=1, writes=1)
+
+    @measured
+    def create_user(self, username, user_data):
+        self._count(reads=2, writes=1)
+        return local_store.create_user(username, user_data, self.path)
+
+    @measured
+    def delete_user(self, username):
+        local_store.delete_user(username, self.path)
+        self._count(writes=1)
+
+    @measured
+    def add_forecast(self, username, record, profile_updates=None):
+        local_store.add_forecast(username, record, profile_updates, self.path)
+        self._count(reads=1 if profile_updates else 0, writes=2 if profile_updates else 1)
+
+    @measured
+    def delete_forecast(self, username, forecast_id):
+        local_store.delete_forecast(username, forecast_id, self.path)
+        self._count(writes=1)
+
+    @measured
+    def clear_forecasts(self, username):
+        local_store.clear_forecasts(username, self.path)
+        self._count(writes=1)
+
+    @measured
+    def count_forecasts(self, username, user_data=None):
+        self._count(reads=1)
+        return local_store.count_forecasts(username, self.path)
+
+    @measured
+    def forecast_page(self, username, cursor=None, limit=5):
+        records = local_store.forecast_page(username, cursor, limit, self.path)
+        self._count(reads=len(records))
+        return records
+
+    @measured
+    def migrate_forecast_history(self, username, records):
+        local_store.add_forecasts(username, records, self.path)
+        local_store.remove_user_fields(username, ['forecast_history'], self.path)
+        self._count(reads=1, writes=len(records) + 1)
+
+
+# ===== IN-MEMORY =====
+class MemoryBackend(StorageBackend):
+    """
+    Dict-based store counting document reads/writes the way Firestore bills
+    them; for running user flows locally and asserting on their cost
+    """
+    name = 'memory'
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self.users = {}
+        self.emails = {}
+        self.forecasts = {}
+
+    @measured
+    def load_users(self):
+        with self._lock:
+            self._count(reads=max(len(self.users), 1))
+            return copy.deepcopy(self.users)
+
+    @measured
+    def save_users(self, users):
+        with self._lock:
+            for username, user_data in users.items():
+                self.users[username] = {**self.users.get(username, {}), **copy.deepcopy(user_data)}
+            self._count(writes=len(users))
+        return True
+
+    @measured
+    def get_user(self, username):
+        with self._lock:
+            self._count(reads=1)
+            return copy.deepcopy(self.users.get(username))
+
+    @measured
+    def update_user(self, username, fields):
+        with self._lock:
+            self.users[username] = {**self.users.get(username, {}), **copy.deepcopy(fields)}
+            self._count(writes=1)
+
+    @measured
+    def create_user(self, username, user_data):
+        with self._lock:
+            email_key = normalize_email(user_data['email'])
+            self._count(reads=2)
+            if username in self.users:
+                return "Username already exists"
+            if email_key in self.emails:
+                return "Email already registered"
+            self.users[username] = copy.deepcopy(user_data)
+            self.emails[email_key] = username
+            self._count(writes=2)
+            return None
+
+    @measured
+    def delete_user(self, username):
+        with self._lock:
+            user_data = self.users.pop(username, None) or {}
+            self._count(reads=1, writes=1)
+            email = user_data.get('email')
+            if email and self.emails.get(normalize_email(email)) == username:
+                del self.emails[normalize_email(email)]
+                self._count(writes=1)
+
+    @measured
+    def add_forecast(self, username, record, profile_updates=None):
+        with self._lock:
+            self.forecasts.setdefault(username, {})[record['id']] = copy.deepcopy(record)
+            profile = self.users.setdefault(username, {})
+            profile.update(copy.deepcopy(profile_updates or {}))
+            profile['forecast_count'] = profile.get('forecast_count', 0) + 1
+            self._count(writes=2)
+
+    @measured
+    def delete_forecast(self, username, forecast_id):
+        with self._lock:
+            if self.forecasts.get(username, {}).pop(forecast_id, None) is not None:
+                profile = self.users.setdefault(username, {})
+                profile['forecast_count'] = max(profile.get('forecast_count', 0) - 1, 0)
+            self._count(writes=2)
+
+    @measured
+    def clear_forecasts(self, username):
+        with self._lock:
+            records = self.forecasts.pop(username, {})
+            self.users.setdefault(username, {})['forecast_count'] = 0
+            self._count(reads=max(len(records), 1), writes=len(records) + 1)
+
+    @measured
+    def count_forecasts(self, username, user_data=None):
+        with self._lock:
+            if user_data is None:
+                self._count(reads=1)
+                user_data = self.users.get(username, {})
+            return int(user_data.get('forecast_count', 0) or 0)
+
+    @measured
+    def forecast_page(self, username, cursor=None, limit=5):
+        with self._lock:
+            ids = sorted(self.forecasts.get(username, {}), reverse=True)
+            if cursor:
+                ids = [forecast_id for forecast_id in ids if forecast_id < cursor]
+            records = [copy.deepcopy(self.forecasts[username][forecast_id]) for forecast_id in ids[:limit]]
+            self._count(reads=max(len(records), 1))
+            return records
+
+    @measured
+    def migrate_forecast_history(self, username, records):
+        with self._lock:
+            for record in records:
+                self.forecasts.setdefault(username, {})[record['id']] = copy.deepcopy(record)
+            self.users.get(username, {}).pop('forecast_history', None)
+            self._count(writes=len(records) + 1)
@@ -0,0 +1,250 @@
+"""
+WRITE-BEHIND QUEUE - FIRESTORE PERSISTENCE
+Coalesced Updates • Batched Commits • Flush on Logout/Shutdown
+"""
+
+import atexit
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from firebase_admin import firestore
+    Increment = firestore.Increment
+except Exception:
+    Increment = None
+
+MAX_BATCH_OPS = 400        # Firestore allows 500 writes per batch
+FLUSH_INTERVAL = 0.25      # seconds the worker waits to collect more writes
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.5        # seconds, doubled on every retry
+
+
+def _merge_fields(old, new):
+    """
+    Merge two field dicts; Increment transforms on the same field add up
+    """
+    merged = dict(old)
+    for field, value in new.items():
+        previous = merged.get(field)
+        if Increment is not None and isinstance(value, Increment) and isinstance(previous, Increment):
+            merged[field] = Increment(previous.value + value.value)
+        else:
+            merged[field] = value
+    return merged
+
+
+def _combine(old, new):
+    """
+    One operation with the effect of old followed by new on the same document.
+    Operations are (kind, ref, data, merge, seq); seq stays the oldest one, so
+    a flush waits for the combined write.
+    """
+    kind, ref, data, merge, seq = new
+    seq = min(seq, old[4])
+    if kind == 'set' and merge:
+        if old[0] == 'set':
+            data, merge = _merge_fields(old[2], data), old[3]
+        else:
+            merge = False
+    return (kind, ref, data, merge, seq)
+
+
+def _matches(path, prefix):
+    return prefix is None or path == prefix or path.startswith(prefix + '/')
+
+
+class WriteBehindQueue:
+    """
+    Accepts set/delete operations keyed by document path and commits them
+    from a worker thread. Pending writes to the same document are coalesced
+    into one, so a burst of updates costs a single write.
+    get_client returns the current Firestore client (it may reconnect between
+    batches); on_error is called with each failed commit's exception.
+    Writes still failing after the last retry are kept in `failed` and go out
+    again with the next write to the same document or the next flush
+    covering them; on_drop(paths, error) is called when that happens.
+    """
+    def __init__(self, get_client, on_error=None, on_drop=None, max_batch_ops=MAX_BATCH_OPS,
+                 flush_interval=FLUSH_INTERVAL, max_retries=MAX_RETRIES, retry_backoff=RETRY_BACKOFF):
+        self.get_client = get_client
+        self.on_error = on_error
+        self.on_drop = on_drop
+        self.max_batch_ops = max_batch_ops
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._pending = OrderedDict()   # path -> (kind, ref, data, merge, seq)
+        self._in_flight = {}            # path -> operation being committed
+        self.failed = {}                # path -> operation that ran out of retries
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.stats = {'enqueued': 0, 'coalesced': 0, 'committed': 0, 'batches': 0,
+                      'retries': 0, 'dropped': 0}
+        self._worker = threading.Thread(target=self._run, name='firestore-write-behind', daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    # ----- producers -----
+    def _enqueue(self, op):
+        path = op[1].path
+        with self._cond:
+            self._seq += 1
+            op = op[:4] + (self._seq,)
+            self.stats['enqueued'] += 1
+            if path in self.failed:
+                op = _combine(self.failed.pop(path), op)
+            pending = self._pending.get(path)
+            if pending is not None:
+                self.stats['coalesced'] += 1
+                op = _combine(pending, op)
+            self._pending[path] = op
+            self._cond.notify_all()
+            return op[4]
+
+    def set(self, ref, data, merge=False):
+        """
+        Queue a document set (merge=True merges fields into the pending write)
+        """
+        return self._enqueue(('set', ref, data, merge, 0))
+
+    def delete(self, ref):
+        """
+        Queue a document delete (replaces any pending write to it)
+        """
+        return self._enqueue(('delete', ref, None, False, 0))
+
+    def pending_count(self, prefix=None):
+        with self._cond:
+            return sum(1 for ops in (self._pending, self._in_flight) for path in ops if _matches(path, prefix))
+
+    def failed_paths(self, prefix=None):
+        with self._cond:
+            return [path for path in self.failed if _matches(path, prefix)]
+
+    def flush(self, timeout=10, prefix=None):
+        """
+        Commit the writes queued so far under prefix (a document path such as
+        'users/alice'; None for all) from the calling thread, retrying failed
+        ones. Only waits on the worker for those of them it is committing
+        already, so other users' writes never hold the caller up.
+        Returns True if they were all committed.
+        """
+        deadline = time.time() + timeout
+        with self._cond:
+            for path in [path for path in self.failed if _matches(path, prefix)]:
+                op = self.failed.pop(path)
+                if path in self._pending:
+                    op = _combine(op, self._pending[path])
+                self._pending[path] = op
+            target = self._seq
+
+        def ours(ops):
+            return [(path, op) for path, op in ops.items() if _matches(path, prefix) and op[4] <= target]
+
+        while True:
+            with self._cond:
+                while ours(self._in_flight):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                ops = ours(self._pending)
+                if not ops:
+                    break
+                for path, op in ops:
+                    del self._pending[path]
+                self._in_flight.update(ops)
+            for start in range(0, len(ops), self.max_batch_ops):
+                self._commit_with_retries(ops[start:start + self.max_batch_ops], deadline)
+
+        with self._cond:
+            return not ours(self.failed)
+
+    def close(self, timeout=10):
+        """
+        Flush and stop the worker (called at interpreter shutdown)
+        """
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if not flushed:
+            print(f"⚠️ Write-behind queue closed with {self.pending_count() + len(self.failed)} writes not committed")
+        return flushed
+
+    # ----- committing -----
+    def _commit(self, ops):
+        batch = self.get_client().batch()
+        for _, (kind, ref, data, merge, _) in ops:
+            if kind == 'delete':
+                batch.delete(ref)
+            else:
+                batch.set(ref, data, merge=merge)
+        batch.commit()
+
+    def _commit_with_retries(self, ops, deadline=None):
+        """
+        Commit in-flight ops, retrying with backoff (no further than deadline);
+        ops that still fail are kept for retry. Returns True if committed.
+        """
+        committed = False
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._commit(ops)
+                committed = True
+                break
+            except Exception as e:
+                error = e
+                if self.on_error is not None:
+                    self.on_error(e)
+                delay = self.retry_backoff * (2 ** attempt)
+                if attempt == self.max_retries or (deadline is not None and time.time() + delay > deadline):
+                    break
+                with self._cond:
+                    self.stats['retries'] += 1
+                print(f"⚠️ Firestore batch failed ({e}); retrying")
+                time.sleep(delay)
+
+        with self._cond:
+            for path, _ in ops:
+                self._in_flight.pop(path, None)
+            if committed:
+                self.stats['committed'] += len(ops)
+                self.stats['batches'] += 1
+            else:
+                self.stats['dropped'] += len(ops)
+                # A newer pending write to the same document absorbs the failed
+                # one, so their order is preserved
+                for path, op in ops:
+                    if path in self._pending:
+                        self._pending[path] = _combine(op, self._pending[path])
+                    else:
+                        self.failed[path] = op
+            self._cond.notify_all()
+        if not committed:
+            print(f"❌ {len(ops)} Firestore writes failed after {attempt + 1} attempts, kept for retry: {error}")
+            if self.on_drop is not None:
+                self.on_drop([path for path, _ in ops], error)
+        return committed
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+            # Give a burst of updates a moment to coalesce
+            time.sleep(self.flush_interval)
+            with self._cond:
+                ops = []
+                for path in list(self._pending):
+                    if len(ops) == self.max_batch_ops:
+                        break
+                    if path not in self._in_flight:   # a flush is committing an older write to it
+                        ops.append((path, self._pending.pop(path)))
+                self._in_flight.update(ops)
+            if ops:
+                self._commit_with_retries(ops)